@@ -1,73 +1,198 @@
 """
 Audit log API endpoints.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, desc
-from typing import Optional
+from sqlalchemy import select, func, desc, tuple_
+from sqlalchemy.orm import load_only
+from pydantic import TypeAdapter
+from typing import Optional, List, Tuple
+from datetime import datetime
+import base64
 
-from app.core.database import get_db
-from app.models.database import User, AuditLog
-from app.models.schemas import AuditLogResponse, AuditLogListResponse
-from app.api.dependencies import get_current_user, require_admin
+from app.core.database import get_db, approx_row_count
+from app.models.database import AuditLog, UserRole
+from app.models.schemas import AuditLogResponse, AuditLogListResponse, TokenData
+from app.api.dependencies import get_current_claims, require_admin_claims
 
 
 router = APIRouter(prefix="/api/audit", tags=["Audit"])
 
+# Validates a whole page of ORM rows in one call instead of one per row
+_audit_logs_adapter = TypeAdapter(List[AuditLogResponse])
+
+# Only load the columns exposed by AuditLogResponse
+_audit_response_columns = load_only(
+    AuditLog.id,
+    AuditLog.user_id,
+    AuditLog.action,
+    AuditLog.action_type,
+    AuditLog.status,
+    AuditLog.biometric_type,
+    AuditLog.similarity_score,
+    AuditLog.pipeline_id,
+    AuditLog.timestamp,
+    AuditLog.details,
+)
+
+
+def _encode_cursor(log: AuditLog) -> str:
+    """Encode the keyset position of an audit log as an opaque cursor."""
+    raw = f"{log.timestamp.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a cursor produced by ``_encode_cursor``.
+    
+    Raises:
+        HTTPException: If the cursor is malformed
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+        timestamp, log_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+async def _fetch_audit_page(
+    db: AsyncSession,
+    filters: list,
+    skip: int,
+    limit: int,
+    cursor: Optional[str] = None,
+    estimate_total: bool = False
+) -> AuditLogListResponse:
+    """
+    Fetch one page of audit logs together with the total match count.
+    
+    Pages are ordered newest first on ``(timestamp, id)``. With a cursor the
+    page starts right after the cursor position (keyset pagination) and
+    ``skip`` is ignored; without one, ``skip`` is used as an offset.
+    
+    On offset pages the total is computed with a ``COUNT(*) OVER ()`` window
+    so the count and the page come back in a single round trip. Cursor pages
+    narrow the WHERE clause, so their total is counted separately. With
+    ``estimate_total`` the total comes from the database statistics instead,
+    when the backend provides them.
+    
+    Args:
+        db: Database session
+        filters: SQLAlchemy filter expressions to apply
+        skip: Number of records to skip
+        limit: Maximum number of records to return
+        cursor: Optional cursor returned by a previous page
+        estimate_total: Use the table row estimate as total (unfiltered only)
+        
+    Returns:
+        Audit log page
+    """
+    order = (desc(AuditLog.timestamp), desc(AuditLog.id))
+    count_query = select(func.count()).select_from(AuditLog).where(*filters)
+    
+    estimated_total = None
+    if estimate_total:
+        estimated_total = await approx_row_count(db, AuditLog.__tablename__)
+    
+    if cursor or estimated_total is not None:
+        query = select(AuditLog).options(_audit_response_columns).where(*filters)
+        if cursor:
+            cursor_ts, cursor_id = _decode_cursor(cursor)
+            query = query.where(
+                tuple_(AuditLog.timestamp, AuditLog.id) < tuple_(cursor_ts, cursor_id)
+            )
+        else:
+            query = query.offset(skip)
+        result = await db.execute(query.order_by(*order).limit(limit))
+        logs = list(result.scalars().all())
+        
+        if estimated_total is not None:
+            total = estimated_total
+        else:
+            total_result = await db.execute(count_query)
+            total = total_result.scalar()
+    else:
+        query = (
+            select(AuditLog, func.count().over().label("full_count"))
+            .options(_audit_response_columns)
+            .where(*filters)
+            .order_by(*order)
+            .offset(skip)
+            .limit(limit)
+        )
+        result = await db.execute(query)
+        rows = result.all()
+        logs = [row.AuditLog for row in rows]
+        
+        if rows:
+            total = rows[0].full_count
+        elif skip == 0:
+            total = 0
+        else:
+            # Page is past the end: the window count is unavailable, count directly
+            total_result = await db.execute(count_query)
+            total = total_result.scalar()
+    
+    return AuditLogListResponse(
+        total=total,
+        total_is_estimate=estimated_total is not None,
+        logs=_audit_logs_adapter.validate_python(logs, from_attributes=True),
+        next_cursor=_encode_cursor(logs[-1]) if len(logs) == limit else None
+    )
+
+
+def _page_response(page: AuditLogListResponse) -> Response:
+    """
+    Serialize an audit page straight to JSON.
+    
+    The page is already validated, so returning a ``Response`` skips
+    FastAPI's second validation pass and the intermediate dict;
+    pydantic-core writes the JSON directly. ``response_model`` on the
+    routes still documents the schema.
+    """
+    return Response(content=page.model_dump_json(), media_type="application/json")
+
 
 @router.get("/logs", response_model=AuditLogListResponse)
 async def get_audit_logs(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
     user_id: Optional[int] = None,
     action_type: Optional[str] = None,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(require_admin)
+    current_user: TokenData = Depends(require_admin_claims)
 ):
     """
     Get audit logs (Admin only).
     
     - **skip**: Number of records to skip (pagination)
     - **limit**: Maximum number of records to return
+    - **cursor**: Cursor from a previous page's ``next_cursor`` (overrides skip)
     - **user_id**: Filter by user ID
     - **action_type**: Filter by action type (enrollment, authentication, approval)
     
-    Returns paginated list of audit logs.
+    Returns paginated list of audit logs. Without filters, ``total`` may be
+    the database's row estimate, flagged by ``total_is_estimate``.
     """
-    # Build query
-    query = select(AuditLog)
-    
-    # Apply filters
+    # Build filters
+    filters = []
     if user_id:
-        query = query.where(AuditLog.user_id == user_id)
+        filters.append(AuditLog.user_id == user_id)
     
     if action_type:
-        query = query.where(AuditLog.action_type == action_type)
-    
-    # Order by timestamp descending
-    query = query.order_by(desc(AuditLog.timestamp))
-    
-    # Get total count
-    count_query = select(func.count()).select_from(AuditLog)
-    if user_id:
-        count_query = count_query.where(AuditLog.user_id == user_id)
-    if action_type:
-        count_query = count_query.where(AuditLog.action_type == action_type)
-    
-    total_result = await db.execute(count_query)
-    total = total_result.scalar()
-    
-    # Apply pagination
-    query = query.offset(skip).limit(limit)
+        filters.append(AuditLog.action_type == action_type)
     
-    # Execute query
-    result = await db.execute(query)
-    logs = result.scalars().all()
-    
-    return AuditLogListResponse(
-        total=total,
-        logs=[AuditLogResponse.model_validate(log) for log in logs]
+    # Counting every row is a full scan; the unfiltered view uses an estimate
+    page = await _fetch_audit_page(
+        db, filters, skip, limit, cursor, estimate_total=not filters
     )
+    return _page_response(page)
 
 
 @router.get("/logs/user/{user_id}", response_model=AuditLogListResponse)
@@ -75,38 +200,22 @@ async def get_user_audit_logs(
     user_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: TokenData = Depends(get_current_claims)
 ):
     """
     Get audit logs for a specific user.
     
     Users can only see their own logs unless they are admin.
+    Pass the returned ``next_cursor`` as ``cursor`` to fetch the next page.
     """
     # Check permissions
-    if current_user.id != user_id and current_user.role.value != "admin":
+    if current_user.user_id != user_id and current_user.role != UserRole.ADMIN.value:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You can only view your own audit logs"
         )
     
-    # Build query
-    query = select(AuditLog).where(AuditLog.user_id == user_id)
-    query = query.order_by(desc(AuditLog.timestamp))
-    
-    # Get total count
-    count_query = select(func.count()).select_from(AuditLog).where(AuditLog.user_id == user_id)
-    total_result = await db.execute(count_query)
-    total = total_result.scalar()
-    
-    # Apply pagination
-    query = query.offset(skip).limit(limit)
-    
-    # Execute query
-    result = await db.execute(query)
-    logs = result.scalars().all()
-    
-    return AuditLogListResponse(
-        total=total,
-        logs=[AuditLogResponse.model_validate(log) for log in logs]
-    )
+    page = await _fetch_audit_page(db, [AuditLog.user_id == user_id], skip, limit, cursor)
+    return _page_response(page)
@@ -4,19 +4,89 @@ Authentication API endpoints.
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, or_
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
 from datetime import datetime
+from typing import Optional
 
 from app.core.database import get_db
-from app.models.database import User
+from app.models.database import User, UserRole
 from app.models.schemas import UserCreate, UserResponse, Token, MessageResponse
 from app.services.auth import auth_service
 from app.utils.encryption import pseudonymize_identifier
-from app.api.dependencies import get_current_user, require_admin
+from app.api.dependencies import (
+    get_current_user,
+    require_admin,
+    invalidate_user_cache,
+    USER_BY_USERNAME
+)
 
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
+# Dialect-specific INSERT constructs supporting ON CONFLICT DO NOTHING
+_CONFLICT_INSERTS = {
+    "postgresql": postgresql_insert,
+    "sqlite": sqlite_insert,
+}
+
+
+async def _insert_user(db: AsyncSession, **values) -> Optional[User]:
+    """
+    Insert a new user unless the username or email is already taken.
+    
+    On PostgreSQL and SQLite this is a single ``INSERT ... ON CONFLICT DO
+    NOTHING RETURNING`` round trip, which is also safe against concurrent
+    registrations. Other backends fall back to an ORM insert.
+    
+    Args:
+        db: Database session
+        **values: Column values for the new user
+        
+    Returns:
+        The created user, or None if a unique column conflicted
+    """
+    conflict_insert = _CONFLICT_INSERTS.get(db.bind.dialect.name)
+    if conflict_insert is not None:
+        stmt = conflict_insert(User).values(**values).on_conflict_do_nothing().returning(User)
+        result = await db.execute(stmt)
+        return result.scalar_one_or_none()
+    
+    new_user = User(**values)
+    db.add(new_user)
+    try:
+        await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        return None
+    return new_user
+
+
+async def _raise_registration_conflict(db: AsyncSession, user_data: UserCreate) -> None:
+    """
+    Report which unique field made a registration fail.
+    
+    Raises:
+        HTTPException: Always, naming the username or email as taken
+    """
+    result = await db.execute(
+        select(User.username, User.email)
+        .where(or_(User.username == user_data.username, User.email == user_data.email))
+        .limit(2)
+    )
+    existing = result.all()
+    
+    if any(row.username == user_data.username for row in existing):
+        detail = "Username already registered"
+    elif existing:
+        detail = "Email already registered"
+    else:
+        detail = "Username or email already registered"
+    
+    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def register_user(
@@ -28,26 +98,6 @@ async def register_user(
     
     Requires GDPR consent to be given.
     """
-    # Check if username already exists
-    result = await db.execute(
-        select(User).where(User.username == user_data.username)
-    )
-    if result.scalar_one_or_none():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
-    
-    # Check if email already exists
-    result = await db.execute(
-        select(User).where(User.email == user_data.email)
-    )
-    if result.scalar_one_or_none():
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
     # Verify consent
     if not user_data.consent_given:
         raise HTTPException(
@@ -56,24 +106,26 @@ async def register_user(
         )
     
     # Create user
-    hashed_password = auth_service.get_password_hash(user_data.password)
+    hashed_password = await auth_service.get_password_hash_async(user_data.password)
     pseudonym = pseudonymize_identifier(user_data.username)
     
-    new_user = User(
+    new_user = await _insert_user(
+        db,
         username=user_data.username,
         email=user_data.email,
         hashed_password=hashed_password,
         full_name=user_data.full_name,
-        role=user_data.role,
+        role=UserRole(user_data.role.value),
         pseudonym=pseudonym,
         consent_given=user_data.consent_given,
         consent_date=datetime.utcnow() if user_data.consent_given else None,
         is_verified=True  # Auto-verify for demo purposes
     )
     
-    db.add(new_user)
+    if new_user is None:
+        await _raise_registration_conflict(db, user_data)
+    
     await db.commit()
-    await db.refresh(new_user)
     
     return new_user
 
@@ -87,12 +139,14 @@ async def login(
     Login with username and password to get JWT token.
     """
     # Get user
-    result = await db.execute(
-        select(User).where(User.username == form_data.username)
-    )
+    result = await db.execute(USER_BY_USERNAME, {"username": form_data.username})
     user = result.scalar_one_or_none()
     
-    if not user or not auth_service.verify_password(form_data.password, user.hashed_password):
+    # Always run a bcrypt comparison so unknown usernames take as long as known ones
+    hashed_password = user.hashed_password if user else auth_service.dummy_password_hash
+    password_valid = await auth_service.verify_password_async(form_data.password, hashed_password)
+    
+    if not user or not password_valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -110,7 +164,9 @@ async def login(
         data={
             "sub": user.username,
             "user_id": user.id,
-            "role": user.role.value
+            "role": user.role.value,
+            "is_active": user.is_active,
+            "consent_given": user.consent_given
         }
     )
     
@@ -138,11 +194,8 @@ async def delete_user_data(
     
     Admin only. Deletes user and all associated biometric data.
     """
-    # Get user
-    result = await db.execute(
-        select(User).where(User.id == user_id)
-    )
-    user = result.scalar_one_or_none()
+    # Get user by primary key (served from the identity map when loaded)
+    user = await db.get(User, user_id)
     
     if not user:
         raise HTTPException(
@@ -153,6 +206,7 @@ async def delete_user_data(
     # Delete user (cascade will handle biometric data)
     await db.delete(user)
     await db.commit()
+    invalidate_user_cache(user_id)
     
     return {
         "message": f"User {user.username} and all associated data deleted successfully",
@@ -31,7 +31,7 @@ async def enroll_biometric(
     
     - **biometric_type**: Type of biometric (face, voice, fingerprint)
     - **consent_confirmed**: User must confirm consent for biometric processing
-    - **file**: Biometric data file (image for face, audio for voice)
+    - **file**: Biometric data file (image for face, audio for voice, preferably 16 kHz mono)
     
     Returns enrollment status and quality score.
     """
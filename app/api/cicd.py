@@ -1,10 +1,12 @@
 """
 CI/CD action approval API endpoints.
 """
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Form, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
+from cachetools import TTLCache
 from datetime import datetime, timedelta
+import hashlib
 import uuid
 
 from app.core.database import get_db
@@ -13,14 +15,28 @@ from app.models.schemas import (
     CICDActionRequest,
     CICDActionResponse,
     ActionApprovalResponse,
-    BiometricTypeEnum
+    BiometricTypeEnum,
+    TokenData
 )
 from app.services.biometric import biometric_service
-from app.api.dependencies import get_current_active_user, validate_biometric_file
+from app.services.audit import audit_writer
+from app.api.dependencies import (
+    get_current_active_user,
+    get_current_active_claims,
+    validate_biometric_file
+)
 
 
 router = APIRouter(prefix="/api/cicd", tags=["CI/CD Actions"])
 
+# Hot lookup statement, built once and executed with a bound action ID
+ACTION_BY_ACTION_ID = select(CICDAction).where(CICDAction.action_id == bindparam("action_id"))
+
+# Status responses of approved/denied actions, which are final, keyed by action ID.
+# The cache is per worker: entries are dropped when this worker writes the
+# action and expire after a minute, so rows changed elsewhere are picked up.
+_finished_actions: TTLCache = TTLCache(maxsize=10_000, ttl=60)
+
 
 @router.post("/request-action", response_model=CICDActionResponse)
 async def request_cicd_action(
@@ -70,10 +86,12 @@ async def request_cicd_action(
         details=action_data.description,
         timestamp=datetime.utcnow()
     )
-    db.add(audit_log)
     
     await db.commit()
     
+    # Queued only once the action exists, so a failed commit leaves no audit trail
+    await audit_writer.enqueue(db, audit_log)
+    
     return CICDActionResponse(
         action_id=action_id,
         status=ActionStatus.PENDING,
@@ -102,9 +120,7 @@ async def approve_cicd_action(
     Returns approval status and similarity score.
     """
     # Get action
-    result = await db.execute(
-        select(CICDAction).where(CICDAction.action_id == action_id)
-    )
+    result = await db.execute(ACTION_BY_ACTION_ID, {"action_id": action_id})
     action = result.scalar_one_or_none()
     
     if not action:
@@ -124,6 +140,7 @@ async def approve_cicd_action(
     if datetime.utcnow() > action.expires_at:
         action.status = ActionStatus.DENIED
         await db.commit()
+        _finished_actions.pop(action_id, None)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Action has expired"
@@ -135,128 +152,135 @@ async def approve_cicd_action(
     # Convert enum to BiometricType
     bio_type = BiometricType[biometric_type.value.upper()]
     
-    # Authenticate using biometric
+    # Authenticate using biometric without committing. A denial's audit entry
+    # is committed together with the action update below; a success's entry
+    # is handed back and enqueued after that commit.
     auth_result = await biometric_service.authenticate_biometric(
         db=db,
         user_id=current_user.id,
         biometric_type=bio_type,
-        biometric_data=biometric_data
+        biometric_data=biometric_data,
+        commit=False
     )
+    pending_audit_log = auth_result.pop("pending_audit_log", None)
     
     if not auth_result["success"]:
-        # Update action status
-        action.status = ActionStatus.DENIED
-        
         # Log failed approval
-        audit_log = AuditLog(
-            user_id=current_user.id,
-            action=f"CI/CD action approval failed: {action.action_type}",
-            action_type="approval",
-            status=ActionStatus.DENIED,
-            biometric_type=bio_type,
-            pipeline_id=action.pipeline_id,
-            pipeline_action=action.action_type,
-            details=auth_result["message"],
-            timestamp=datetime.utcnow()
-        )
-        db.add(audit_log)
-        await db.commit()
-        
-        return ActionApprovalResponse(
-            success=False,
-            action_id=action_id,
-            status=ActionStatus.DENIED,
-            approved=False,
-            message="Biometric authentication failed",
-            similarity_score=auth_result.get("similarity_score")
-        )
-    
-    # Check if biometric authentication succeeded
-    if not auth_result["authenticated"]:
         action.status = ActionStatus.DENIED
-        
-        audit_log = AuditLog(
-            user_id=current_user.id,
-            action=f"CI/CD action denied: {action.action_type}",
-            action_type="approval",
-            status=ActionStatus.DENIED,
-            biometric_type=bio_type,
-            similarity_score=auth_result.get("similarity_score"),
-            pipeline_id=action.pipeline_id,
-            pipeline_action=action.action_type,
-            details="Biometric verification failed",
-            timestamp=datetime.utcnow()
-        )
-        db.add(audit_log)
-        await db.commit()
-        
-        return ActionApprovalResponse(
-            success=False,
-            action_id=action_id,
-            status=ActionStatus.DENIED,
-            approved=False,
-            message="Biometric verification failed. Action denied.",
-            similarity_score=auth_result.get("similarity_score")
-        )
+        audit_action = f"CI/CD action approval failed: {action.action_type}"
+        details = auth_result["message"]
+        message = "Biometric authentication failed"
+    elif not auth_result["authenticated"]:
+        # Biometric verification did not match
+        action.status = ActionStatus.DENIED
+        audit_action = f"CI/CD action denied: {action.action_type}"
+        details = "Biometric verification failed"
+        message = "Biometric verification failed. Action denied."
+    else:
+        # Approve action
+        action.status = ActionStatus.APPROVED
+        action.approver_id = current_user.id
+        action.approval_method = biometric_type.value
+        action.approved_at = datetime.utcnow()
+        audit_action = f"CI/CD action approved: {action.action_type}"
+        details = f"Action approved via {biometric_type.value}"
+        message = "Action approved successfully. CI/CD pipeline can proceed."
     
-    # Approve action
-    action.status = ActionStatus.APPROVED
-    action.approver_id = current_user.id
-    action.approval_method = biometric_type.value
-    action.approved_at = datetime.utcnow()
+    approved = action.status == ActionStatus.APPROVED
     
-    # Log successful approval
+    # Log the approval outcome
     audit_log = AuditLog(
         user_id=current_user.id,
-        action=f"CI/CD action approved: {action.action_type}",
+        action=audit_action,
         action_type="approval",
-        status=ActionStatus.APPROVED,
+        status=action.status,
         biometric_type=bio_type,
         similarity_score=auth_result.get("similarity_score"),
         pipeline_id=action.pipeline_id,
         pipeline_action=action.action_type,
-        details=f"Action approved via {biometric_type.value}",
+        details=details,
         timestamp=datetime.utcnow()
     )
-    db.add(audit_log)
+    # Denials are committed with the action update; approvals go to the batch
+    # writer once that update is committed
+    if not approved:
+        db.add(audit_log)
     
     await db.commit()
+    _finished_actions.pop(action_id, None)
+    
+    if pending_audit_log is not None:
+        await audit_writer.enqueue(db, pending_audit_log)
+    if approved:
+        await audit_writer.enqueue(db, audit_log)
     
     return ActionApprovalResponse(
-        success=True,
+        success=approved,
         action_id=action_id,
-        status=ActionStatus.APPROVED,
-        approved=True,
-        message="Action approved successfully. CI/CD pipeline can proceed.",
+        status=action.status,
+        approved=approved,
+        message=message,
         similarity_score=auth_result.get("similarity_score")
     )
 
 
+def _action_etag(action: CICDAction) -> str:
+    """Build an ETag from the fields that change over an action's lifetime."""
+    state = f"{action.status.value}|{action.approved_at}|{action.expires_at}"
+    return '"' + hashlib.blake2b(state.encode(), digest_size=8).hexdigest() + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    """Check whether the request's If-None-Match header contains the ETag."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = {value.strip().removeprefix("W/") for value in if_none_match.split(",")}
+    return etag in candidates or "*" in candidates
+
+
 @router.get("/action-status/{action_id}", response_model=CICDActionResponse)
 async def get_action_status(
     action_id: str,
+    request: Request,
+    response: Response,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_active_user)
+    current_user: TokenData = Depends(get_current_active_claims)
 ):
     """
     Get the status of a CI/CD action.
     
-    Returns current status (pending, approved, or denied).
+    Returns current status (pending, approved, or denied). Supports
+    conditional requests: send the returned ``ETag`` as ``If-None-Match``
+    to get ``304 Not Modified`` while the status is unchanged.
     """
-    result = await db.execute(
-        select(CICDAction).where(CICDAction.action_id == action_id)
-    )
-    action = result.scalar_one_or_none()
-    
-    if not action:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Action not found"
+    cached = _finished_actions.get(action_id)
+    if cached is not None:
+        etag, action_response = cached
+    else:
+        result = await db.execute(ACTION_BY_ACTION_ID, {"action_id": action_id})
+        action = result.scalar_one_or_none()
+        
+        if not action:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Action not found"
+            )
+        
+        etag = _action_etag(action)
+        action_response = CICDActionResponse(
+            action_id=action.action_id,
+            status=action.status,
+            message=f"Action is {action.status.value}",
+            expires_at=action.expires_at
         )
+        
+        # Approved and denied actions never change again
+        if action.status != ActionStatus.PENDING:
+            _finished_actions[action_id] = (etag, action_response)
     
-    return CICDActionResponse(
-        action_id=action.action_id,
-        status=action.status,
-        message=f"Action is {action.status.value}",
-        expires_at=action.expires_at
-    )
+    if _etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
+    return action_response
@@ -4,8 +4,12 @@ API dependencies for authentication and authorization.
 from fastapi import Depends, HTTPException, status, UploadFile, File
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, bindparam, inspect
 from typing import Optional
+from cachetools import TTLCache
+import hashlib
+import logging
+import time
 
 from app.core.database import get_db
 from app.models.database import User, UserRole
@@ -13,9 +17,57 @@ from app.services.auth import auth_service
 from app.models.schemas import TokenData
 
 
+logger = logging.getLogger(__name__)
+
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
+# Hot lookup statement, built once and executed with a bound username
+USER_BY_USERNAME = select(User).where(User.username == bindparam("username"))
+
+# Short-lived cache of token -> (user, token expiry) to skip the user SELECT
+# on repeated requests with the same bearer token. Entries are transient User
+# snapshots that belong to no session and must be treated as read-only.
+_user_cache: TTLCache = TTLCache(maxsize=10_000, ttl=30)
+
+# Column attributes copied into cached user snapshots
+_USER_COLUMNS = tuple(attr.key for attr in inspect(User).column_attrs)
+
+
+def _token_cache_key(token: str) -> bytes:
+    """Hash a bearer token into a compact cache key."""
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def _user_snapshot(user: User) -> User:
+    """
+    Copy a loaded user into a transient instance for the token cache.
+    
+    The request's own instance is bound to its session; a rollback there
+    would expire it and every later request served from the cache would
+    fail with ``DetachedInstanceError``. The copy is attached to no
+    session, so nothing can expire it.
+    
+    Args:
+        user: User loaded in the current session
+        
+    Returns:
+        Transient User with the same column values
+    """
+    return User(**{key: getattr(user, key) for key in _USER_COLUMNS})
+
+
+def invalidate_user_cache(user_id: int) -> None:
+    """
+    Drop all cached token lookups for a user.
+    
+    Args:
+        user_id: ID of the user whose cached sessions must be forgotten
+    """
+    for key, (user, _) in list(_user_cache.items()):
+        if user.id == user_id:
+            _user_cache.pop(key, None)
+
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
@@ -40,6 +92,15 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
+    # Serve repeated requests with the same token from the cache
+    cache_key = _token_cache_key(token)
+    cached = _user_cache.get(cache_key)
+    if cached is not None:
+        user, expires_at = cached
+        if time.time() < expires_at and user.is_active:
+            return user
+        _user_cache.pop(cache_key, None)
+    
     # Decode token
     payload = auth_service.decode_token(token)
     if payload is None:
@@ -50,9 +111,7 @@ async def get_current_user(
         raise credentials_exception
     
     # Get user from database
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
+    result = await db.execute(USER_BY_USERNAME, {"username": username})
     user = result.scalar_one_or_none()
     
     if user is None:
@@ -64,6 +123,8 @@ async def get_current_user(
             detail="User account is inactive"
         )
     
+    _user_cache[cache_key] = (_user_snapshot(user), payload.get("exp", 0))
+    
     return user
 
 
@@ -97,6 +158,74 @@ async def get_current_active_user(
     return current_user
 
 
+async def get_current_claims(
+    token: str = Depends(oauth2_scheme)
+) -> TokenData:
+    """
+    Get the current user's identity from the JWT claims alone.
+    
+    Unlike ``get_current_user`` this does not query the database; use it on
+    read-only endpoints that only need the user ID and role. Claims reflect
+    the user at token issue time, bounded by the token lifetime.
+    
+    Args:
+        token: JWT access token
+        
+    Returns:
+        Token claims
+        
+    Raises:
+        HTTPException: If token is invalid or the user was inactive when issued
+    """
+    payload = auth_service.decode_token(token)
+    if payload is None or payload.get("sub") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    claims = TokenData(
+        username=payload["sub"],
+        user_id=payload.get("user_id"),
+        role=payload.get("role"),
+        is_active=payload.get("is_active", False),
+        consent_given=payload.get("consent_given", False)
+    )
+    
+    if not claims.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User account is inactive"
+        )
+    
+    return claims
+
+
+async def get_current_active_claims(
+    claims: TokenData = Depends(get_current_claims)
+) -> TokenData:
+    """
+    Get the current user's claims, requiring GDPR consent.
+    
+    Args:
+        claims: Current token claims
+        
+    Returns:
+        Token claims
+        
+    Raises:
+        HTTPException: If consent was not given
+    """
+    if not claims.consent_given:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User consent not given. Biometric operations require consent."
+        )
+    
+    return claims
+
+
 def require_role(required_role: UserRole):
     """
     Dependency factory for role-based access control.
@@ -139,6 +268,63 @@ async def require_admin(current_user: User = Depends(get_current_active_user)) -
     return current_user
 
 
+async def require_admin_claims(
+    claims: TokenData = Depends(get_current_active_claims)
+) -> TokenData:
+    """
+    Require admin role, checked from the token claims only.
+    
+    Args:
+        claims: Current token claims
+        
+    Returns:
+        Claims of an admin user
+        
+    Raises:
+        HTTPException: If user is not admin
+    """
+    if claims.role != UserRole.ADMIN.value:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required"
+        )
+    return claims
+
+
+# Magic numbers of supported upload formats, matched against the first bytes
+# of the file loaded as one big-endian integer: (shift, value, format)
+_FILE_SIGNATURES = (
+    (40, 0xFFD8FF, "jpeg"),
+    (32, 0x89504E47, "png"),
+    (40, 0x474946, "gif"),
+    (32, 0x52494646, "wav"),
+    (32, 0x664C6143, "flac"),
+    (40, 0x494433, "mp3"),
+)
+_MP4_FTYP = 0x66747970  # b"ftyp" at offset 4
+
+_UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def _sniff_file_format(content: bytes) -> Optional[str]:
+    """
+    Identify an upload from its leading magic number.
+    
+    Args:
+        content: File contents
+        
+    Returns:
+        Format name, or None if the signature is not recognized
+    """
+    head = int.from_bytes(content[:8].ljust(8, b"\0"), "big")
+    for shift, value, file_format in _FILE_SIGNATURES:
+        if head >> shift == value:
+            return file_format
+    if head & 0xFFFFFFFF == _MP4_FTYP:
+        return "mp4"
+    return None
+
+
 async def validate_biometric_file(
     file: UploadFile = File(...)
 ) -> bytes:
@@ -156,14 +342,24 @@ async def validate_biometric_file(
     """
     # Check file size (max 10MB)
     max_size = 10 * 1024 * 1024
+    too_large = HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail="File too large. Maximum size is 10MB"
+    )
     
-    content = await file.read()
+    # Reject early when the declared size is already over the limit
+    if file.size is not None and file.size > max_size:
+        raise too_large
     
-    if len(content) > max_size:
-        raise HTTPException(
-            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-            detail="File too large. Maximum size is 10MB"
-        )
+    # Read in chunks so an oversized upload is never held in memory
+    chunks = []
+    total = 0
+    while chunk := await file.read(_UPLOAD_CHUNK_SIZE):
+        total += len(chunk)
+        if total > max_size:
+            raise too_large
+        chunks.append(chunk)
+    content = b"".join(chunks)
     
     if len(content) == 0:
         raise HTTPException(
@@ -171,23 +367,9 @@ async def validate_biometric_file(
             detail="Empty file"
         )
     
-    # Validate file type based on content
-    # Check for common image formats (JPEG, PNG)
-    is_image = (
-        content.startswith(b'\xff\xd8\xff') or  # JPEG
-        content.startswith(b'\x89PNG') or  # PNG
-        content.startswith(b'GIF')  # GIF
-    )
-    
-    # Check for common audio formats
-    is_audio = (
-        content.startswith(b'RIFF') or  # WAV
-        content.startswith(b'fLaC') or  # FLAC
-        content.startswith(b'ID3') or content[4:8] == b'ftyp'  # MP3, MP4
-    )
-    
-    if not (is_image or is_audio):
-        # Allow it anyway - some formats may not have clear signatures
-        pass
+    # Validate file type based on content. Unknown signatures are allowed
+    # anyway - some formats may not have clear signatures.
+    if _sniff_file_format(content) is None:
+        logger.debug("Unrecognized biometric file signature")
     
     return content
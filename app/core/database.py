@@ -1,21 +1,53 @@
 """
 Database connection and initialization.
 """
+from typing import Optional
+import asyncio
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 
 from config.settings import settings
 from app.models.database import Base
 
 
+def _engine_options(database_url: str) -> dict:
+    """
+    Build connection pool options for the configured database.
+    
+    In-memory SQLite must share a single connection (StaticPool), file-based
+    SQLite gets a small queue pool, and server databases use the tunable
+    ``db_pool_size``/``db_max_overflow`` settings. SQL compilation is cached
+    by SQLAlchemy's default engine-level statement cache.
+    """
+    if "sqlite" in database_url:
+        options = {"connect_args": {"check_same_thread": False}}
+        if ":memory:" in database_url:
+            options["poolclass"] = StaticPool
+        else:
+            options["poolclass"] = AsyncAdaptedQueuePool
+            options["pool_size"] = 5
+        return options
+    
+    options = {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+    }
+    if "asyncpg" in database_url:
+        # Keep server-side prepared statements for the hot lookups per connection
+        options["connect_args"] = {"prepared_statement_cache_size": 500}
+    return options
+
+
 # Create async engine
 engine = create_async_engine(
     settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {},
-    poolclass=StaticPool if "sqlite" in settings.database_url else None,
     echo=settings.debug,
+    **_engine_options(settings.database_url),
 )
-
 # Create session factory
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -33,12 +65,68 @@ async def get_db():
             await session.close()
 
 
+async def approx_row_count(db: AsyncSession, table_name: str) -> Optional[int]:
+    """
+    Get the planner's row estimate for a table from the database catalog.
+    
+    Args:
+        db: Database session
+        table_name: Name of the table
+        
+    Returns:
+        Estimated row count, or None if the backend has no cheap estimate
+    """
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        query = text("SELECT reltuples::bigint FROM pg_class WHERE relname = :t")
+    elif dialect == "mysql":
+        query = text(
+            "SELECT table_rows FROM information_schema.tables "
+            "WHERE table_schema = DATABASE() AND table_name = :t"
+        )
+    else:
+        return None
+    
+    result = await db.execute(query, {"t": table_name})
+    estimate = result.scalar()
+    
+    # PostgreSQL reports -1 for tables that were never analyzed
+    if estimate is None or estimate < 0:
+        return None
+    return int(estimate)
+
+
 async def init_db():
     """Initialize the database by creating all tables."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
 
 
+async def warmup_pool():
+    """
+    Open the pool's connections up front so the first requests after startup
+    do not pay the connection handshake.
+    
+    All connections are held open together, otherwise the pool would hand the
+    same connection back to each task.
+    """
+    pool_size = engine.pool.size() if hasattr(engine.pool, "size") else 1
+    connections = []
+    
+    async def _connect():
+        conn = await engine.connect().start()
+        connections.append(conn)
+        await conn.execute(text("SELECT 1"))
+    
+    try:
+        async with asyncio.TaskGroup() as tg:
+            for _ in range(pool_size):
+                tg.create_task(_connect())
+    finally:
+        for conn in connections:
+            await conn.close()
+
+
 async def close_db():
     """Close database connections."""
     await engine.dispose()
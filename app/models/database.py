@@ -5,7 +5,7 @@ from datetime import datetime
 from typing import Optional
 from enum import Enum as PyEnum
 
-from sqlalchemy import String, Integer, DateTime, Boolean, LargeBinary, Text, Enum
+from sqlalchemy import String, Integer, DateTime, Boolean, LargeBinary, Text, Enum, Index, text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
 
@@ -74,6 +74,16 @@ class BiometricData(Base):
     
     # Quality metrics
     quality_score: Mapped[Optional[float]] = mapped_column(nullable=True)
+    
+    # Covers the (user_id, biometric_type, is_active) enrollment lookup;
+    # on PostgreSQL only active rows are indexed to keep it small
+    __table_args__ = (
+        Index(
+            "ix_biometric_active_lookup",
+            "user_id", "biometric_type", "is_active",
+            postgresql_where=text("is_active"),
+        ),
+    )
 
 
 class AuditLog(Base):
@@ -99,10 +109,18 @@ class AuditLog(Base):
     # Metadata
     ip_address: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
     user_agent: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)
+    # Stamped in Python (UTC, microseconds) like every other audit path, so
+    # that (timestamp, id) orders rows consistently for cursor pagination
     timestamp: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, index=True)
     
     # Additional details
     details: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    
+    # Composite indexes matching the audit listing filters (newest first)
+    __table_args__ = (
+        Index("ix_audit_user_ts", "user_id", timestamp.desc()),
+        Index("ix_audit_type_ts", "action_type", timestamp.desc()),
+    )
 
 
 class CICDAction(Base):
@@ -72,6 +72,8 @@ class TokenData(BaseModel):
     username: Optional[str] = None
     user_id: Optional[int] = None
     role: Optional[str] = None
+    is_active: Optional[bool] = None
+    consent_given: Optional[bool] = None
 
 
 # Biometric schemas
@@ -155,7 +157,9 @@ class AuditLogResponse(BaseModel):
 class AuditLogListResponse(BaseModel):
     """Schema for audit log list response."""
     total: int
+    total_is_estimate: bool = False
     logs: List[AuditLogResponse]
+    next_cursor: Optional[str] = None
 
 
 # Metrics schemas
@@ -0,0 +1,153 @@
+"""
+Background audit log writer batching inserts outside the request path.
+"""
+from datetime import datetime
+from enum import Enum
+from typing import Dict, List, Optional
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import json
+import logging
+
+from app.core.database import AsyncSessionLocal
+from app.models.database import AuditLog
+
+
+logger = logging.getLogger(__name__)
+
+# Queue marker telling the writer to stop once everything before it is written
+_STOP = object()
+
+# Columns copied from queued audit logs into the INSERT; the ID is generated
+_AUDIT_COLUMNS = tuple(column.key for column in AuditLog.__table__.columns if column.key != "id")
+
+
+class AuditWriter:
+    """Service queueing audit logs and writing them in batches."""
+    
+    def __init__(
+        self,
+        max_queue_size: int = 10_000,
+        batch_size: int = 500,
+        max_attempts: int = 3,
+        retry_delay: float = 0.1
+    ):
+        """
+        Initialize the audit writer.
+        
+        Args:
+            max_queue_size: Maximum number of audit logs waiting to be written
+            batch_size: Maximum number of audit logs written per commit
+            max_attempts: Number of tries for a batch before writing row by row
+            retry_delay: Delay before the first retry in seconds, doubled each time
+        """
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+    
+    def start(self) -> None:
+        """Start the background writer task on the running event loop."""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        """Write all queued audit logs and stop the background writer."""
+        if self._task is None:
+            return
+        queue, self._queue = self._queue, None
+        await queue.put(_STOP)
+        await self._task
+        self._task = None
+    
+    async def enqueue(self, db: AsyncSession, audit_log: AuditLog) -> None:
+        """
+        Queue the audit log of an already committed change for background writing.
+        
+        Call this only after the caller's transaction committed: the writer
+        uses its own session, so a queued log is stored even if that
+        transaction later rolls back. Falls back to writing the log through
+        the caller's session when the writer is not running or the queue is
+        full. Logs without a timestamp are stamped now, since the database
+        default would record the batch flush time instead of the event time.
+        
+        Args:
+            db: Caller's database session, used as fallback
+            audit_log: Audit log to write
+        """
+        if audit_log.timestamp is None:
+            audit_log.timestamp = datetime.utcnow()
+        
+        if self._queue is not None:
+            try:
+                self._queue.put_nowait(audit_log)
+                return
+            except asyncio.QueueFull:
+                logger.warning("Audit queue full, writing audit log inline")
+        db.add(audit_log)
+        await db.commit()
+    
+    async def _run(self) -> None:
+        """Drain the queue, committing up to ``batch_size`` logs at a time."""
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            records = [record for record in batch if record is not _STOP]
+            if records:
+                await self._write(records)
+            
+            if len(records) != len(batch):
+                return
+    
+    async def _write(self, records: List[AuditLog]) -> None:
+        """
+        Insert a batch of audit logs, retrying before giving up on any row.
+        
+        The batch is retried with exponential backoff, which covers transient
+        errors such as a locked database. If it still fails, each row is
+        inserted on its own so one bad row cannot lose the rest. A row that
+        cannot be written at all is logged as a JSON record instead.
+        """
+        rows = [{key: getattr(record, key) for key in _AUDIT_COLUMNS} for record in records]
+        
+        for attempt in range(self.max_attempts):
+            try:
+                await self._insert(rows)
+                return
+            except Exception:
+                logger.warning(
+                    "Failed to write %d audit logs (attempt %d of %d)",
+                    len(rows), attempt + 1, self.max_attempts, exc_info=True
+                )
+            if attempt + 1 < self.max_attempts:
+                await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        
+        for row in rows:
+            try:
+                await self._insert([row])
+            except Exception:
+                logger.exception("Audit log could not be written: %s", json.dumps(row, default=self._json_default))
+    
+    @staticmethod
+    async def _insert(rows: List[Dict]) -> None:
+        """Insert audit log rows in one transaction."""
+        async with AsyncSessionLocal() as session:
+            await session.execute(insert(AuditLog), rows)
+            await session.commit()
+    
+    @staticmethod
+    def _json_default(value):
+        """Render enums and datetimes of a spilled audit row."""
+        return value.value if isinstance(value, Enum) else str(value)
+
+
+# Global instance
+audit_writer = AuditWriter()
@@ -1,16 +1,38 @@
 """
 Authentication service with JWT token management.
 """
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
-from passlib.context import CryptContext
-from jose import JWTError, jwt
+import asyncio
+import base64
+import calendar
+import hashlib
+import hmac
+import json
+import os
+import time
+import bcrypt
+import jwt
+from cachetools import TTLCache
 
 from config.settings import settings
 
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt only uses the first 72 bytes of a password
+_BCRYPT_MAX_PASSWORD_BYTES = 72
+
+# bcrypt is CPU-bound and releases the GIL, so hashing runs on a dedicated
+# thread pool instead of blocking the event loop
+_hash_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1, thread_name_prefix="pwd-hash")
+
+# HMAC algorithms signed directly, without going through jwt.encode
+_HMAC_DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+
+def _b64url(data: bytes) -> bytes:
+    """Base64url-encode without padding, as JWS requires."""
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
 
 
 class AuthService:
@@ -21,6 +43,19 @@ class AuthService:
         self.secret_key = settings.secret_key
         self.algorithm = settings.algorithm
         self.access_token_expire_minutes = settings.access_token_expire_minutes
+        self.bcrypt_rounds = settings.bcrypt_rounds
+        # The JWS header and key never change, so encode them once
+        self._signing_key = self.secret_key.encode()
+        self._header_b64 = _b64url(
+            json.dumps({"alg": self.algorithm, "typ": "JWT"}, separators=(",", ":")).encode()
+        )
+        # Verified token -> (payload, exp); entries never outlive a token's lifetime
+        self._decoded_tokens: TTLCache = TTLCache(
+            maxsize=8192, ttl=self.access_token_expire_minutes * 60
+        )
+        # Hash verified for unknown users so login timing does not reveal them.
+        # Built here, before any request is served, so bcrypt never runs on the loop
+        self.dummy_password_hash = self.get_password_hash("dummy-password-for-timing")
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """
@@ -33,7 +68,14 @@ class AuthService:
         Returns:
             True if password matches, False otherwise
         """
-        return pwd_context.verify(plain_password, hashed_password)
+        try:
+            return bcrypt.checkpw(
+                plain_password.encode("utf-8")[:_BCRYPT_MAX_PASSWORD_BYTES],
+                hashed_password.encode("utf-8")
+            )
+        except ValueError:
+            # Malformed or non-bcrypt hash
+            return False
     
     def get_password_hash(self, password: str) -> str:
         """
@@ -45,7 +87,40 @@ class AuthService:
         Returns:
             Hashed password
         """
-        return pwd_context.hash(password)
+        hashed = bcrypt.hashpw(
+            password.encode("utf-8")[:_BCRYPT_MAX_PASSWORD_BYTES],
+            bcrypt.gensalt(rounds=self.bcrypt_rounds)
+        )
+        return hashed.decode("utf-8")
+    
+    async def verify_password_async(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Verify a password against a hash without blocking the event loop.
+        
+        Args:
+            plain_password: Plain text password
+            hashed_password: Hashed password
+            
+        Returns:
+            True if password matches, False otherwise
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _hash_pool, self.verify_password, plain_password, hashed_password
+        )
+    
+    async def get_password_hash_async(self, password: str) -> str:
+        """
+        Hash a password without blocking the event loop.
+        
+        Args:
+            password: Plain text password
+            
+        Returns:
+            Hashed password
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_pool, self.get_password_hash, password)
     
     def create_access_token(self, data: dict, expires_delta: Optional[timedelta] = None) -> str:
         """
@@ -66,25 +141,53 @@ class AuthService:
             expire = datetime.utcnow() + timedelta(minutes=self.access_token_expire_minutes)
         
         to_encode.update({"exp": expire})
-        encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
         
-        return encoded_jwt
+        digest = _HMAC_DIGESTS.get(self.algorithm)
+        if digest is None:
+            return jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+        
+        # Sign "header.payload" with the precomputed header; only the payload varies
+        to_encode["exp"] = calendar.timegm(expire.utctimetuple())
+        payload_b64 = _b64url(json.dumps(to_encode, separators=(",", ":")).encode())
+        signing_input = self._header_b64 + b"." + payload_b64
+        signature = hmac.new(self._signing_key, signing_input, digest).digest()
+        
+        return (signing_input + b"." + _b64url(signature)).decode()
     
     def decode_token(self, token: str) -> Optional[dict]:
         """
         Decode and verify a JWT token.
         
+        Successfully verified tokens are cached until they expire, so repeated
+        requests with the same token skip signature verification. The returned
+        payload may be shared between calls and must not be modified.
+        
         Args:
             token: JWT token string
             
         Returns:
             Decoded token data, or None if invalid
         """
+        cached = self._decoded_tokens.get(token)
+        if cached is not None:
+            payload, expires_at = cached
+            if time.time() < expires_at:
+                return payload
+            self._decoded_tokens.pop(token, None)
+            return None
+        
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
-            return payload
-        except JWTError:
+            payload = jwt.decode(
+                token,
+                self.secret_key,
+                algorithms=[self.algorithm],
+                options={"require": ["exp"]}
+            )
+        except jwt.PyJWTError:
             return None
+        
+        self._decoded_tokens[token] = (payload, payload["exp"])
+        return payload
 
 
 # Global instance
@@ -1,21 +1,66 @@
 """
 Biometric service for enrollment and authentication operations.
 """
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import load_only
+from cachetools import LRUCache
 import numpy as np
+import hashlib
 from datetime import datetime
 
 from app.models.database import BiometricData, BiometricType, User, AuditLog, ActionStatus
+from app.services.audit import audit_writer
 from app.services.face_recognition import face_recognition_service
 from app.services.voice_recognition import voice_recognition_service
 from app.utils.encryption import encryption_service
 
 
+# Columns needed to match against an enrollment; quality and dates stay unloaded
+_enrolled_columns = load_only(
+    BiometricData.id,
+    BiometricData.user_id,
+    BiometricData.encrypted_descriptor,
+    BiometricData.last_used,
+)
+
+
 class BiometricService:
     """Service for biometric operations."""
     
+    def __init__(self, descriptor_cache_size: int = 4096):
+        """
+        Initialize biometric service.
+        
+        Args:
+            descriptor_cache_size: Number of decrypted descriptors kept in memory
+        """
+        self._descriptor_cache: LRUCache = LRUCache(maxsize=descriptor_cache_size)
+    
+    def _decrypt_enrolled(self, enrolled_biometric: BiometricData) -> np.ndarray:
+        """
+        Decrypt an enrolled descriptor, reusing earlier decryptions.
+        
+        The cache key includes a hash of the encrypted blob, so re-enrollment
+        (which stores a new ciphertext) never returns a stale descriptor.
+        
+        Args:
+            enrolled_biometric: Enrolled biometric row
+            
+        Returns:
+            Decrypted descriptor (read-only)
+        """
+        encrypted = enrolled_biometric.encrypted_descriptor
+        blob_hash = hashlib.blake2b(encrypted, digest_size=16).digest()
+        key = (enrolled_biometric.id, blob_hash)
+        
+        descriptor = self._descriptor_cache.get(key)
+        if descriptor is None:
+            descriptor = encryption_service.decrypt_descriptor(encrypted)
+            self._descriptor_cache[key] = descriptor
+        return descriptor
+    
     async def enroll_biometric(
         self,
         db: AsyncSession,
@@ -38,8 +83,7 @@ class BiometricService:
         try:
             # Extract features based on biometric type
             if biometric_type == BiometricType.FACE:
-                features = face_recognition_service.extract_face_encoding(biometric_data)
-                quality = face_recognition_service.calculate_quality_score(biometric_data)
+                features, quality = await face_recognition_service.analyze_async(biometric_data)
             elif biometric_type == BiometricType.VOICE:
                 features = voice_recognition_service.extract_voice_features(biometric_data)
                 quality = voice_recognition_service.calculate_quality_score(biometric_data)
@@ -59,14 +103,17 @@ class BiometricService:
             encrypted_features = encryption_service.encrypt_descriptor(features)
             
             # Check if user already has this biometric type enrolled
-            result = await db.execute(
-                select(BiometricData).where(
+            # Only the primary key is needed to update the row in place
+            existing = await db.scalar(
+                select(BiometricData)
+                .where(
                     BiometricData.user_id == user_id,
                     BiometricData.biometric_type == biometric_type,
                     BiometricData.is_active == True
                 )
+                .options(load_only(BiometricData.id))
+                .limit(1)
             )
-            existing = result.scalar_one_or_none()
             
             if existing:
                 # Update existing enrollment
@@ -89,13 +136,14 @@ class BiometricService:
                 action=f"Biometric enrollment: {biometric_type.value}",
                 action_type="enrollment",
                 status=ActionStatus.APPROVED,
-                biometric_type=biometric_type,
-                timestamp=datetime.utcnow()
+                biometric_type=biometric_type
             )
-            db.add(audit_log)
             
             await db.commit()
             
+            # Queued after the commit so a failed enrollment is never logged as approved
+            await audit_writer.enqueue(db, audit_log)
+            
             return {
                 "success": True,
                 "message": f"{biometric_type.value.capitalize()} enrolled successfully",
@@ -109,12 +157,43 @@ class BiometricService:
                 "message": f"Enrollment error: {str(e)}"
             }
     
+    async def get_active_descriptors(
+        self,
+        db: AsyncSession,
+        user_ids: List[int],
+        biometric_type: BiometricType
+    ) -> Dict[int, BiometricData]:
+        """
+        Fetch the active enrollments of several users in one query.
+        
+        Args:
+            db: Database session
+            user_ids: User IDs to look up
+            biometric_type: Type of biometric
+            
+        Returns:
+            Mapping of user ID to enrolled biometric data (users without an
+            active enrollment are absent)
+        """
+        result = await db.scalars(
+            select(BiometricData)
+            .where(
+                BiometricData.user_id.in_(user_ids),
+                BiometricData.biometric_type == biometric_type,
+                BiometricData.is_active == True
+            )
+            .options(_enrolled_columns)
+        )
+        return {row.user_id: row for row in result}
+    
     async def authenticate_biometric(
         self,
         db: AsyncSession,
         user_id: int,
         biometric_type: BiometricType,
-        biometric_data: bytes
+        biometric_data: bytes,
+        commit: bool = True,
+        enrolled: Optional[Dict[int, BiometricData]] = None
     ) -> Dict:
         """
         Authenticate a user using biometric data.
@@ -124,78 +203,87 @@ class BiometricService:
             user_id: User ID
             biometric_type: Type of biometric
             biometric_data: Raw biometric data
+            commit: Commit the audit log here. Pass False to leave the changes
+                pending in the caller's transaction; a successful match's audit
+                log is then returned as ``pending_audit_log`` for the caller
+                to enqueue after its own commit.
+            enrolled: Enrolled data prefetched with ``get_active_descriptors``;
+                skips the per-user lookup when given
             
         Returns:
             Dictionary with authentication result
         """
         try:
-            # Extract features from provided biometric data
-            if biometric_type == BiometricType.FACE:
-                new_features = face_recognition_service.extract_face_encoding(biometric_data)
-            elif biometric_type == BiometricType.VOICE:
-                new_features = voice_recognition_service.extract_voice_features(biometric_data)
-            else:
+            if biometric_type not in (BiometricType.FACE, BiometricType.VOICE):
                 return {
                     "success": False,
                     "authenticated": False,
                     "message": f"Biometric type {biometric_type} not yet implemented"
                 }
             
-            if new_features is None:
-                # Log failed attempt
+            # Retrieve enrolled biometric data first, so unenrolled users never pay
+            # for feature extraction
+            if enrolled is not None:
+                enrolled_biometric = enrolled.get(user_id)
+            else:
+                enrolled_biometric = await db.scalar(
+                    select(BiometricData)
+                    .where(
+                        BiometricData.user_id == user_id,
+                        BiometricData.biometric_type == biometric_type,
+                        BiometricData.is_active == True
+                    )
+                    .options(_enrolled_columns)
+                    .limit(1)
+                )
+            
+            if not enrolled_biometric:
                 audit_log = AuditLog(
                     user_id=user_id,
                     action=f"Biometric authentication: {biometric_type.value}",
                     action_type="authentication",
                     status=ActionStatus.DENIED,
                     biometric_type=biometric_type,
-                    details="Failed to extract features",
-                    timestamp=datetime.utcnow()
+                    details="No enrolled biometric data found"
                 )
                 db.add(audit_log)
-                await db.commit()
+                if commit:
+                    await db.commit()
                 
                 return {
                     "success": False,
                     "authenticated": False,
-                    "message": f"Failed to extract {biometric_type.value} features"
+                    "message": f"No enrolled {biometric_type.value} data found"
                 }
             
-            # Retrieve enrolled biometric data
-            result = await db.execute(
-                select(BiometricData).where(
-                    BiometricData.user_id == user_id,
-                    BiometricData.biometric_type == biometric_type,
-                    BiometricData.is_active == True
-                )
-            )
-            enrolled_biometric = result.scalar_one_or_none()
+            # Extract features from provided biometric data
+            if biometric_type == BiometricType.FACE:
+                new_features = await face_recognition_service.extract_face_encoding_async(biometric_data)
+            else:
+                new_features = voice_recognition_service.extract_voice_features(biometric_data)
             
-            if not enrolled_biometric:
+            if new_features is None:
+                # Log failed attempt
                 audit_log = AuditLog(
                     user_id=user_id,
                     action=f"Biometric authentication: {biometric_type.value}",
                     action_type="authentication",
                     status=ActionStatus.DENIED,
                     biometric_type=biometric_type,
-                    details="No enrolled biometric data found",
-                    timestamp=datetime.utcnow()
+                    details="Failed to extract features"
                 )
                 db.add(audit_log)
-                await db.commit()
+                if commit:
+                    await db.commit()
                 
                 return {
                     "success": False,
                     "authenticated": False,
-                    "message": f"No enrolled {biometric_type.value} data found"
+                    "message": f"Failed to extract {biometric_type.value} features"
                 }
             
             # Decrypt enrolled features
-            enrolled_features = encryption_service.decrypt_descriptor(
-                enrolled_biometric.encrypted_descriptor,
-                shape=new_features.shape,
-                dtype=new_features.dtype
-            )
+            enrolled_features = self._decrypt_enrolled(enrolled_biometric)
             
             # Compare features
             if biometric_type == BiometricType.FACE:
@@ -219,20 +307,29 @@ class BiometricService:
                 action_type="authentication",
                 status=ActionStatus.APPROVED if is_match else ActionStatus.DENIED,
                 biometric_type=biometric_type,
-                similarity_score=similarity,
-                timestamp=datetime.utcnow()
+                similarity_score=similarity
             )
-            db.add(audit_log)
-            
-            await db.commit()
+            # Denials are written with this transaction; successes go to the batch
+            # writer once it is committed
+            if not is_match:
+                db.add(audit_log)
             
-            return {
+            result = {
                 "success": True,
                 "authenticated": is_match,
                 "similarity_score": similarity,
                 "message": "Authentication successful" if is_match else "Authentication failed"
             }
             
+            if commit:
+                await db.commit()
+                if is_match:
+                    await audit_writer.enqueue(db, audit_log)
+            elif is_match:
+                result["pending_audit_log"] = audit_log
+            
+            return result
+            
         except Exception as e:
             await db.rollback()
             return {
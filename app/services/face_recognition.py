@@ -1,26 +1,197 @@
 """
 Facial recognition service using face_recognition library.
 """
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import asyncio
+import logging
+import multiprocessing
+import os
 import face_recognition
+import cv2
+import dlib
 import numpy as np
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple
 import io
 from PIL import Image
 
 from config.settings import settings
 
 
+logger = logging.getLogger(__name__)
+
+
+def _warm_dlib() -> None:
+    """Run the detector and encoder once so each worker loads dlib's models up front."""
+    face_recognition.face_encodings(np.zeros((32, 32, 3), dtype=np.uint8))
+
+
+# Face detection and encoding are CPU-bound and hold the GIL for long
+# stretches, so they run in worker processes instead of the event loop.
+# The pool is created on first use and replaced if a worker dies.
+_face_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _get_face_pool() -> ProcessPoolExecutor:
+    """
+    Return the face worker pool, creating it on first use.
+    
+    Workers are spawned rather than forked from the threaded server process.
+    """
+    global _face_pool
+    if _face_pool is None:
+        _face_pool = ProcessPoolExecutor(
+            max_workers=max(1, (os.cpu_count() or 2) // 2),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_dlib,
+        )
+    return _face_pool
+
+
+def _discard_face_pool(pool: ProcessPoolExecutor) -> None:
+    """
+    Drop a broken pool so the next call creates a fresh one.
+    
+    Only the pool that failed is discarded; if another caller already
+    replaced it, the replacement is kept.
+    """
+    global _face_pool
+    if _face_pool is pool:
+        _face_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_face_pool() -> None:
+    """Stop the face worker processes, if they were started."""
+    global _face_pool
+    pool, _face_pool = _face_pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
 class FaceRecognitionService:
     """Service for facial recognition operations."""
     
-    def __init__(self, tolerance: float = None):
+    def __init__(self, tolerance: float = None, detection_model: str = None):
         """
         Initialize facial recognition service.
         
         Args:
             tolerance: Face comparison tolerance (lower is more strict)
+            detection_model: Face detector, "hog", "cnn" or "auto" (CNN when
+                dlib is built with CUDA, HOG otherwise)
         """
         self.tolerance = tolerance or settings.face_recognition_tolerance
+        self.detection_model = self._resolve_detection_model(
+            detection_model or settings.face_detection_model
+        )
+    
+    @staticmethod
+    def _resolve_detection_model(detection_model: str) -> str:
+        """
+        Pick the face detector to use.
+        
+        dlib's CNN detector is far more expensive than HOG on CPU, so "auto"
+        only selects it when dlib can run it on the GPU.
+        
+        Args:
+            detection_model: "hog", "cnn" or "auto"
+            
+        Returns:
+            "hog" or "cnn"
+        
+        Raises:
+            ValueError: If the detector name is unknown
+        """
+        if detection_model == "auto":
+            return "cnn" if getattr(dlib, "DLIB_USE_CUDA", False) else "hog"
+        if detection_model not in ("hog", "cnn"):
+            raise ValueError(f"Unknown face detection model: {detection_model}")
+        return detection_model
+    
+    def _load_image(self, image_data: bytes) -> np.ndarray:
+        """
+        Decode image bytes into an RGB array.
+        
+        Args:
+            image_data: Image data as bytes
+            
+        Returns:
+            Image as an (H, W, 3) numpy array
+        """
+        image = Image.open(io.BytesIO(image_data))
+        image_array = np.array(image)
+        
+        # Convert to RGB if needed, in one vectorized pass into a contiguous array
+        if len(image_array.shape) == 2:  # Grayscale
+            image_array = cv2.cvtColor(image_array, cv2.COLOR_GRAY2RGB)
+        elif image_array.shape[2] == 4:  # RGBA
+            image_array = cv2.cvtColor(image_array, cv2.COLOR_RGBA2RGB)
+        
+        return image_array
+    
+    def _quality_from_location(self, face_location: Tuple[int, int, int, int], image_shape: Tuple[int, ...]) -> float:
+        """
+        Score a detected face by how much of the image it covers.
+        
+        Args:
+            face_location: (top, right, bottom, left) box of the face
+            image_shape: Shape of the image array
+            
+        Returns:
+            Quality score (0-1, higher is better)
+        """
+        # Calculate face size (larger is generally better)
+        top, right, bottom, left = face_location
+        face_width = right - left
+        face_height = bottom - top
+        face_area = face_width * face_height
+        
+        # Normalize by image size
+        image_area = image_shape[0] * image_shape[1]
+        face_ratio = face_area / image_area
+        
+        # Quality score based on face size (optimal is 20-60% of image)
+        if face_ratio < 0.1:
+            quality = face_ratio * 5  # Too small
+        elif face_ratio > 0.6:
+            quality = (1.0 - face_ratio) * 2.5  # Too large
+        else:
+            quality = 1.0  # Good size
+        
+        return min(max(quality, 0.0), 1.0)
+    
+    def analyze(self, image_data: bytes) -> Tuple[Optional[np.ndarray], float]:
+        """
+        Extract the face encoding and quality score in a single pass.
+        
+        The image is decoded and the face detector runs once; the detected
+        location is reused for both the encoding and the quality score.
+        
+        Args:
+            image_data: Image data as bytes
+            
+        Returns:
+            Tuple of (face encoding or None if no face found, quality score)
+        """
+        try:
+            image_array = self._load_image(image_data)
+            
+            face_locations = face_recognition.face_locations(image_array, model=self.detection_model)
+            if not face_locations:
+                return None, 0.0
+            
+            # Encode only the first face, reusing its detected location
+            face_encodings = face_recognition.face_encodings(
+                image_array, known_face_locations=face_locations[:1]
+            )
+            encoding = face_encodings[0] if face_encodings else None
+            
+            return encoding, self._quality_from_location(face_locations[0], image_array.shape)
+            
+        except Exception as e:
+            print(f"Error analyzing face image: {e}")
+            return None, 0.0
     
     def extract_face_encoding(self, image_data: bytes) -> Optional[np.ndarray]:
         """
@@ -33,18 +204,11 @@ class FaceRecognitionService:
             Face encoding as numpy array, or None if no face found
         """
         try:
-            # Load image from bytes
-            image = Image.open(io.BytesIO(image_data))
-            image_array = np.array(image)
-            
-            # Convert to RGB if needed
-            if len(image_array.shape) == 2:  # Grayscale
-                image_array = np.stack([image_array] * 3, axis=-1)
-            elif image_array.shape[2] == 4:  # RGBA
-                image_array = image_array[:, :, :3]
+            image_array = self._load_image(image_data)
             
             # Detect faces and get encodings
-            face_encodings = face_recognition.face_encodings(image_array)
+            face_locations = face_recognition.face_locations(image_array, model=self.detection_model)
+            face_encodings = face_recognition.face_encodings(image_array, known_face_locations=face_locations)
             
             if len(face_encodings) == 0:
                 return None
@@ -56,6 +220,60 @@ class FaceRecognitionService:
             print(f"Error extracting face encoding: {e}")
             return None
     
+    async def _run_in_pool(self, func: Callable, image_data: bytes):
+        """
+        Run a face analysis method in the worker pool.
+        
+        A worker that dies (out of memory, or a crash inside dlib) leaves the
+        whole executor broken. The pool is then rebuilt and the call retried
+        once, so one bad image cannot disable face processing for good.
+        
+        Args:
+            func: Bound method of this service to run
+            image_data: Image data as bytes
+            
+        Returns:
+            The method's result
+            
+        Raises:
+            BrokenProcessPool: If the call also kills the rebuilt pool
+        """
+        loop = asyncio.get_running_loop()
+        for attempt in range(2):
+            pool = _get_face_pool()
+            try:
+                return await loop.run_in_executor(pool, func, image_data)
+            except BrokenProcessPool:
+                logger.warning("Face worker pool broken, restarting it")
+                _discard_face_pool(pool)
+                if attempt:
+                    raise
+    
+    async def analyze_async(self, image_data: bytes) -> Tuple[Optional[np.ndarray], float]:
+        """
+        Run analyze() in the face worker pool without blocking the event loop.
+        
+        Args:
+            image_data: Image data as bytes
+            
+        Returns:
+            Tuple of (face encoding or None if no face found, quality score)
+        """
+        return await self._run_in_pool(self.analyze, image_data)
+    
+    async def extract_face_encoding_async(self, image_data: bytes) -> Optional[np.ndarray]:
+        """
+        Run extract_face_encoding() in the face worker pool without blocking
+        the event loop.
+        
+        Args:
+            image_data: Image data as bytes
+            
+        Returns:
+            Face encoding as numpy array, or None if no face found
+        """
+        return await self._run_in_pool(self.extract_face_encoding, image_data)
+    
     def compare_faces(self, known_encoding: np.ndarray, unknown_encoding: np.ndarray) -> Tuple[bool, float]:
         """
         Compare two face encodings.
@@ -83,6 +301,43 @@ class FaceRecognitionService:
             print(f"Error comparing faces: {e}")
             return False, 0.0
     
+    def compare_many(
+        self,
+        known_matrix: np.ndarray,
+        probe: np.ndarray,
+        known_sq: Optional[np.ndarray] = None
+    ) -> Tuple[int, float, np.ndarray]:
+        """
+        Compare one face encoding against many enrolled encodings at once.
+        
+        Distances come from ``|k|^2 + |p|^2 - 2 k.p`` so the whole search is
+        a single matrix-vector product instead of a Python loop.
+        
+        Args:
+            known_matrix: Enrolled encodings as an (N, 128) array, one per row
+            probe: Face encoding to identify
+            known_sq: Optional precomputed squared row norms of known_matrix
+            
+        Returns:
+            Tuple of (index of the closest encoding, its distance,
+            boolean array of rows within tolerance). The index is -1 and the
+            distance infinite when known_matrix is empty.
+        """
+        known_matrix = np.asarray(known_matrix, dtype=np.float32)
+        probe = np.asarray(probe, dtype=np.float32)
+        
+        if len(known_matrix) == 0:
+            return -1, float("inf"), np.zeros(0, dtype=bool)
+        
+        if known_sq is None:
+            known_sq = np.einsum("ij,ij->i", known_matrix, known_matrix)
+        
+        d2 = known_sq + probe @ probe - 2.0 * (known_matrix @ probe)
+        distances = np.sqrt(np.maximum(d2, 0.0))
+        
+        best = int(np.argmin(distances))
+        return best, float(distances[best]), distances <= self.tolerance
+    
     def calculate_quality_score(self, image_data: bytes) -> float:
         """
         Calculate quality score for a face image.
@@ -94,47 +349,15 @@ class FaceRecognitionService:
             Quality score (0-1, higher is better)
         """
         try:
-            # Load image
-            image = Image.open(io.BytesIO(image_data))
-            image_array = np.array(image)
-            
-            # Convert to RGB if needed
-            if len(image_array.shape) == 2:
-                image_array = np.stack([image_array] * 3, axis=-1)
-            elif image_array.shape[2] == 4:
-                image_array = image_array[:, :, :3]
-            
-            # Detect face landmarks
-            face_landmarks_list = face_recognition.face_landmarks(image_array)
-            
-            if not face_landmarks_list:
-                return 0.0
+            image_array = self._load_image(image_data)
             
-            # Basic quality metrics
-            face_locations = face_recognition.face_locations(image_array)
+            # Detect the face; landmarks are found exactly when a face is
+            face_locations = face_recognition.face_locations(image_array, model=self.detection_model)
             
             if not face_locations:
                 return 0.0
             
-            # Calculate face size (larger is generally better)
-            top, right, bottom, left = face_locations[0]
-            face_width = right - left
-            face_height = bottom - top
-            face_area = face_width * face_height
-            
-            # Normalize by image size
-            image_area = image_array.shape[0] * image_array.shape[1]
-            face_ratio = face_area / image_area
-            
-            # Quality score based on face size (optimal is 20-60% of image)
-            if face_ratio < 0.1:
-                quality = face_ratio * 5  # Too small
-            elif face_ratio > 0.6:
-                quality = (1.0 - face_ratio) * 2.5  # Too large
-            else:
-                quality = 1.0  # Good size
-            
-            return min(max(quality, 0.0), 1.0)
+            return self._quality_from_location(face_locations[0], image_array.shape)
             
         except Exception as e:
             print(f"Error calculating quality score: {e}")
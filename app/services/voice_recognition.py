@@ -3,61 +3,176 @@ Voice recognition service using librosa for MFCC extraction.
 """
 import librosa
 import numpy as np
+from cachetools import LRUCache
 from typing import Optional, Tuple
+import hashlib
 import io
+import math
+import scipy.fftpack
 import soundfile as sf
-from scipy.spatial.distance import cosine
+import soxr
 
 from config.settings import settings
 
 
+# librosa.feature.mfcc defaults for the mel and dB steps; the STFT framing
+# comes from settings (voice_n_fft, voice_hop_length, voice_win_length)
+_MFCC_N_MELS = 128
+_MFCC_AMIN = 1e-10
+_MFCC_TOP_DB = 80.0
+
+
 class VoiceRecognitionService:
     """Service for voice recognition operations using MFCC features."""
     
-    def __init__(self, n_mfcc: int = None):
+    def __init__(self, n_mfcc: int = None, sample_rate: int = None, feature_cache_size: int = 512):
         """
         Initialize voice recognition service.
         
         Args:
             n_mfcc: Number of MFCC coefficients to extract
+            sample_rate: Rate audio is resampled to before feature extraction
+            feature_cache_size: Number of extracted feature vectors kept in memory
         """
         self.n_mfcc = n_mfcc or settings.voice_mfcc_n_mfcc
+        self.sample_rate = sample_rate or settings.voice_sample_rate
+        self.n_fft = settings.voice_n_fft
+        self.hop_length = settings.voice_hop_length
+        self.win_length = settings.voice_win_length
+        self._feature_cache: LRUCache = LRUCache(maxsize=feature_cache_size)
+        
+        # Orthonormal DCT-II as a matrix, truncated to the kept coefficients
+        self._dct_basis = scipy.fftpack.dct(
+            np.eye(_MFCC_N_MELS), type=2, norm="ortho", axis=0
+        )[:self.n_mfcc].astype(np.float32)
+        
+        # Mel filterbanks per sample rate; other rates are added on first use
+        self._mel_bases = {}
+        self._mel_basis(self.sample_rate)
+    
+    def _mel_basis(self, sr: int) -> np.ndarray:
+        """
+        Mel filterbank for a sample rate, built once and then reused.
+        
+        Args:
+            sr: Sample rate of the audio
+            
+        Returns:
+            (n_mels, 1 + n_fft // 2) float32 filterbank
+        """
+        mel_basis = self._mel_bases.get(sr)
+        if mel_basis is None:
+            mel_basis = librosa.filters.mel(sr=sr, n_fft=self.n_fft, n_mels=_MFCC_N_MELS)
+            self._mel_bases[sr] = mel_basis
+        return mel_basis
+    
+    def _mfcc(self, y: np.ndarray, sr: int) -> np.ndarray:
+        """
+        MFCC matrix equivalent to ``librosa.feature.mfcc`` with this service's
+        ``n_mfcc``, ``n_fft``, ``hop_length`` and ``win_length``.
+        
+        The mel filterbank and DCT matrix are cached instead of being rebuilt
+        on every call, and both projections run as plain matrix products.
+        
+        Args:
+            y: Mono float32 signal
+            sr: Sample rate of the signal
+            
+        Returns:
+            (n_mfcc, frames) MFCC matrix
+        """
+        stft = librosa.stft(
+            y, n_fft=self.n_fft, hop_length=self.hop_length, win_length=self.win_length
+        )
+        
+        # |X|^2, squaring the imaginary part in place inside the STFT buffer
+        power = np.square(stft.real)
+        imag = stft.imag
+        power += np.square(imag, out=imag)
+        
+        mel = self._mel_basis(sr) @ power
+        
+        # power_to_db with ref=1.0
+        log_mel = np.log10(np.maximum(mel, _MFCC_AMIN, out=mel), out=mel)
+        log_mel *= 10.0
+        np.maximum(log_mel, log_mel.max() - _MFCC_TOP_DB, out=log_mel)
+        
+        return self._dct_basis @ log_mel
     
     def extract_voice_features(self, audio_data: bytes) -> Optional[np.ndarray]:
         """
         Extract MFCC features from audio data.
         
+        Audio at any other rate is resampled to ``self.sample_rate`` first, so
+        a recording gives the same features whatever rate it was saved at.
+        Results are cached by a hash of the audio bytes, so the same file
+        submitted again skips decoding and MFCC extraction.
+        
         Args:
             audio_data: Audio data as bytes
             
         Returns:
-            MFCC feature vector as numpy array, or None if extraction fails
+            MFCC feature vector as numpy array (read-only), or None if extraction fails
         """
+        key = hashlib.blake2b(audio_data, digest_size=16).digest()
+        features = self._feature_cache.get(key)
+        if features is not None:
+            return features
+        
         try:
             # Load audio from bytes
             audio_io = io.BytesIO(audio_data)
-            y, sr = sf.read(audio_io)
+            y, sr = sf.read(audio_io, dtype="float32")
             
             # If stereo, convert to mono
-            if len(y.shape) > 1:
-                y = np.mean(y, axis=1)
+            if y.ndim > 1:
+                y = y.mean(axis=1, dtype=np.float32)
             
-            # Extract MFCC features
-            mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=self.n_mfcc)
+            if sr != self.sample_rate:
+                y = soxr.resample(y, sr, self.sample_rate)
+                sr = self.sample_rate
             
-            # Calculate statistics across time (mean and std)
-            mfcc_mean = np.mean(mfccs, axis=1)
-            mfcc_std = np.std(mfccs, axis=1)
+            # Extract MFCC features
+            mfccs = self._mfcc(y, sr)
             
-            # Combine mean and std into a single feature vector
-            features = np.concatenate([mfcc_mean, mfcc_std])
+            # Calculate statistics across time (mean and std) into a single feature vector
+            features = self._mfcc_statistics(mfccs)
             
+            # Cached vectors are shared between callers
+            features.setflags(write=False)
+            self._feature_cache[key] = features
             return features
             
         except Exception as e:
             print(f"Error extracting voice features: {e}")
             return None
     
+    @staticmethod
+    def _mfcc_statistics(mfccs: np.ndarray) -> np.ndarray:
+        """
+        Per-coefficient mean and standard deviation of an MFCC matrix.
+        
+        The variance comes from E[x^2] - E[x]^2, so the matrix is read once
+        for the sums of squares instead of np.std's centered second pass.
+        Both moments are accumulated in float64 to keep the subtraction exact
+        enough for float32 input.
+        
+        Args:
+            mfccs: (n_mfcc, frames) MFCC matrix
+            
+        Returns:
+            Feature vector [means..., stds...] in the dtype of ``mfccs``
+        """
+        n_mfcc, frames = mfccs.shape
+        mean = mfccs.mean(axis=1, dtype=np.float64)
+        mean_sq = np.einsum("ij,ij->i", mfccs, mfccs, dtype=np.float64) / frames
+        
+        # Write both halves into one preallocated vector
+        features = np.empty(2 * n_mfcc, dtype=mfccs.dtype)
+        features[:n_mfcc] = mean
+        np.sqrt(np.maximum(mean_sq - mean * mean, 0.0), out=features[n_mfcc:], casting="same_kind")
+        return features
+    
     def compare_voices(self, known_features: np.ndarray, unknown_features: np.ndarray) -> Tuple[bool, float]:
         """
         Compare two voice feature vectors.
@@ -67,11 +182,17 @@ class VoiceRecognitionService:
             unknown_features: Voice features to compare
             
         Returns:
-            Tuple of (is_match, similarity_score)
+            Tuple of (is_match, similarity_score). A zero vector has no
+            direction and scores 0.0.
         """
         try:
-            # Calculate cosine similarity
-            cos_distance = cosine(known_features, unknown_features)
+            # Calculate cosine distance with direct dot products, clipped to
+            # [0, 2] like scipy.spatial.distance.cosine
+            uv = float(np.dot(known_features, unknown_features))
+            norms = math.sqrt(float(np.dot(known_features, known_features)) *
+                              float(np.dot(unknown_features, unknown_features)))
+            cos_distance = 1.0 - uv / norms if norms else 1.0
+            cos_distance = min(max(cos_distance, 0.0), 2.0)
             
             # Convert to similarity score (0-1, higher is more similar)
             similarity_score = 1.0 - cos_distance
@@ -85,6 +206,59 @@ class VoiceRecognitionService:
             print(f"Error comparing voices: {e}")
             return False, 0.0
     
+    def compare_voices_batch(
+        self,
+        known_matrix: np.ndarray,
+        unknown_features: np.ndarray,
+        known_normalized: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Compare one voice feature vector against many enrolled vectors at once.
+        
+        Args:
+            known_matrix: (N, D) matrix of enrolled feature vectors, one per row
+            unknown_features: Voice features to compare
+            known_normalized: Rows of known_matrix already have unit L2 norm,
+                so only the probe is normalized
+            
+        Returns:
+            Tuple of (similarity scores, boolean match mask), one entry per row
+        """
+        # Keep an empty enrollment list two-dimensional so it yields empty results
+        known_matrix = np.asarray(known_matrix).reshape(-1, len(unknown_features))
+        
+        if known_normalized:
+            probe_norm = np.linalg.norm(unknown_features)
+            if probe_norm:
+                similarities = known_matrix @ (unknown_features / probe_norm)
+            else:
+                similarities = np.zeros(len(known_matrix))
+        else:
+            similarities = self._cosine_similarities(unknown_features, known_matrix)
+        
+        # Clip rounding overshoot like compare_voices
+        similarities = np.clip(similarities, -1.0, 1.0)
+        return similarities, similarities >= settings.similarity_threshold
+    
+    @staticmethod
+    def _cosine_similarities(known_features: np.ndarray, features: np.ndarray) -> np.ndarray:
+        """
+        Cosine similarity of each row of ``features`` with ``known_features``.
+        
+        Args:
+            known_features: Reference feature vector
+            features: (N, D) matrix of feature vectors
+            
+        Returns:
+            Array of N similarities (0.0 where a vector has zero norm, as in
+            compare_voices)
+        """
+        norms = np.linalg.norm(features, axis=1) * np.linalg.norm(known_features)
+        dots = features @ known_features
+        similarities = np.zeros_like(dots)
+        np.divide(dots, norms, out=similarities, where=norms != 0, casting="same_kind")
+        return similarities
+    
     def calculate_quality_score(self, audio_data: bytes) -> float:
         """
         Calculate quality score for an audio sample.
@@ -98,18 +272,15 @@ class VoiceRecognitionService:
         try:
             # Load audio from bytes
             audio_io = io.BytesIO(audio_data)
-            y, sr = sf.read(audio_io)
+            y, sr = sf.read(audio_io, dtype="float32")
             
             # If stereo, convert to mono
-            if len(y.shape) > 1:
-                y = np.mean(y, axis=1)
+            if y.ndim > 1:
+                y = y.mean(axis=1, dtype=np.float32)
             
             # Calculate quality metrics
             
-            # 1. Signal-to-noise ratio (simplified)
-            signal_power = np.mean(y ** 2)
-            
-            # 2. Duration (optimal is 2-10 seconds)
+            # 1. Duration (optimal is 2-10 seconds)
             duration = len(y) / sr
             if duration < 1.0:
                 duration_score = duration
@@ -118,8 +289,10 @@ class VoiceRecognitionService:
             else:
                 duration_score = 1.0
             
-            # 3. Dynamic range
-            dynamic_range = np.max(np.abs(y)) - np.min(np.abs(y))
+            # 2. Dynamic range; the decoded signal is not needed afterwards,
+            # so it is rectified in place
+            abs_y = np.abs(y, out=y)
+            dynamic_range = float(abs_y.max() - abs_y.min())
             dynamic_score = min(dynamic_range * 2, 1.0)
             
             # Combine scores
@@ -135,6 +308,11 @@ class VoiceRecognitionService:
         """
         Calculate FAR, FRR, and EER metrics.
         
+        Every distinct similarity score is tried as the acceptance threshold
+        (score >= threshold accepts), so the EER is exact rather than read
+        off a fixed grid. Sorting the scores once turns each FAR/FRR value
+        into a binary search.
+        
         Args:
             known_features: Reference features
             test_features_list: List of tuples (features, is_genuine)
@@ -143,37 +321,32 @@ class VoiceRecognitionService:
             Dictionary with FAR, FRR, EER values
         """
         try:
-            thresholds = np.linspace(0, 1, 100)
-            far_list = []
-            frr_list = []
-            
-            for threshold in thresholds:
-                false_accepts = 0
-                false_rejects = 0
-                total_imposters = 0
-                total_genuine = 0
-                
-                for features, is_genuine in test_features_list:
-                    _, similarity = self.compare_voices(known_features, features)
-                    
-                    if is_genuine:
-                        total_genuine += 1
-                        if similarity < threshold:
-                            false_rejects += 1
-                    else:
-                        total_imposters += 1
-                        if similarity >= threshold:
-                            false_accepts += 1
-                
-                far = false_accepts / total_imposters if total_imposters > 0 else 0
-                frr = false_rejects / total_genuine if total_genuine > 0 else 0
-                
-                far_list.append(far)
-                frr_list.append(frr)
+            if test_features_list:
+                features = np.stack([features for features, _ in test_features_list])
+                genuine = np.array([is_genuine for _, is_genuine in test_features_list], dtype=bool)
+            else:
+                features = np.empty((0, len(known_features)))
+                genuine = np.empty(0, dtype=bool)
+            
+            # Similarities do not depend on the threshold, so compute them once
+            similarities = self._cosine_similarities(known_features, features)
+            
+            total_genuine = int(genuine.sum())
+            total_imposters = len(genuine) - total_genuine
+            
+            genuine_scores = np.sort(similarities[genuine])
+            imposter_scores = np.sort(similarities[~genuine])
+            
+            # Candidate thresholds: each observed score, plus one rejecting everything
+            thresholds = np.append(np.unique(similarities), np.inf)
+            
+            false_rejects = np.searchsorted(genuine_scores, thresholds, side="left")
+            false_accepts = total_imposters - np.searchsorted(imposter_scores, thresholds, side="left")
+            
+            far_array = false_accepts / total_imposters if total_imposters > 0 else np.zeros(len(thresholds))
+            frr_array = false_rejects / total_genuine if total_genuine > 0 else np.zeros(len(thresholds))
             
             # Find EER (Equal Error Rate)
-            far_array = np.array(far_list)
-            frr_array = np.array(frr_list)
             eer_idx = np.argmin(np.abs(far_array - frr_array))
             eer = (far_array[eer_idx] + frr_array[eer_idx]) / 2
             
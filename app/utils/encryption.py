@@ -3,69 +3,131 @@ Encryption utilities for securing biometric data.
 """
 import hashlib
 import base64
+import os
+from typing import Dict, Optional, Tuple
 from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
 import numpy as np
 
 from config.settings import settings
 
 
+# Leading byte of AES-GCM descriptors (raw float32 under the HKDF-derived key);
+# Fernet tokens written before it are base64 text and start with b"g".
+_AESGCM_VERSION = b"\x03"
+_AESGCM_NONCE_SIZE = 12
+
+_KDF_SALT = b'biometric-cicd-salt'  # In production, use a random salt stored securely
+_HKDF_INFO = b'biometric-descriptor-aes-256-gcm'
+
+
 class EncryptionService:
     """Service for encrypting and decrypting biometric descriptors."""
     
+    # PBKDF2 is deterministic for a given key and salt, so each Fernet key is
+    # derived once per process no matter how many services are constructed
+    _fernet_key_cache: Dict[Tuple[str, bytes], bytes] = {}
+    
     def __init__(self, key: str = None):
         """Initialize encryption service with a key."""
         self.key = key or settings.encryption_key
-        self._cipher = self._create_cipher()
+        self._aesgcm = self._create_cipher()
+        self._fernet: Optional[Fernet] = None
     
-    def _create_cipher(self) -> Fernet:
-        """Create a Fernet cipher from the encryption key."""
-        # Derive a proper key from the encryption key
-        kdf = PBKDF2(
+    def _create_cipher(self) -> AESGCM:
+        """
+        Create the AES-GCM cipher used for descriptors.
+        
+        The key is expanded from the configured secret with HKDF-SHA256. The
+        secret is a server key rather than a password, so a single HMAC pass
+        is enough and no stretching is needed.
+        
+        Returns:
+            AESGCM cipher
+        """
+        hkdf = HKDF(
             algorithm=hashes.SHA256(),
             length=32,
-            salt=b'biometric-cicd-salt',  # In production, use a random salt stored securely
-            iterations=100000,
+            salt=_KDF_SALT,
+            info=_HKDF_INFO,
             backend=default_backend()
         )
-        key = base64.urlsafe_b64encode(kdf.derive(self.key.encode()))
-        return Fernet(key)
+        return AESGCM(hkdf.derive(self.key.encode()))
+    
+    def _get_fernet(self) -> Fernet:
+        """
+        Create the Fernet cipher that descriptors were encrypted with before
+        AES-GCM.
+        
+        It is only needed to read those descriptors, so the 100000-iteration
+        PBKDF2 derivation runs on the first such read instead of at startup.
+        
+        Returns:
+            Fernet cipher
+        """
+        if self._fernet is None:
+            cache_key = (self.key, _KDF_SALT)
+            fernet_key = self._fernet_key_cache.get(cache_key)
+            if fernet_key is None:
+                kdf = PBKDF2HMAC(
+                    algorithm=hashes.SHA256(),
+                    length=32,
+                    salt=_KDF_SALT,
+                    iterations=100000,
+                    backend=default_backend()
+                )
+                fernet_key = base64.urlsafe_b64encode(kdf.derive(self.key.encode()))
+                self._fernet_key_cache[cache_key] = fernet_key
+            self._fernet = Fernet(fernet_key)
+        return self._fernet
     
     def encrypt_descriptor(self, descriptor: np.ndarray) -> bytes:
         """
         Encrypt a biometric descriptor.
         
+        The descriptor is stored as raw little-endian float32 values, so a
+        128-D face encoding encrypts to a fixed 541 bytes.
+        
         Args:
             descriptor: NumPy array containing biometric features
             
         Returns:
             Encrypted bytes
         """
-        # Convert numpy array to bytes
-        descriptor_bytes = descriptor.tobytes()
-        # Encrypt
-        encrypted = self._cipher.encrypt(descriptor_bytes)
-        return encrypted
+        # Convert numpy array to its canonical float32 bytes
+        descriptor_bytes = np.ascontiguousarray(descriptor, dtype="<f4").tobytes()
+        # Encrypt with AES-256-GCM under a fresh random nonce
+        nonce = os.urandom(_AESGCM_NONCE_SIZE)
+        encrypted = self._aesgcm.encrypt(nonce, descriptor_bytes, None)
+        return _AESGCM_VERSION + nonce + encrypted
     
-    def decrypt_descriptor(self, encrypted_data: bytes, shape: tuple, dtype=np.float64) -> np.ndarray:
+    def decrypt_descriptor(self, encrypted_data: bytes, shape: tuple = None, dtype=np.float64) -> np.ndarray:
         """
         Decrypt a biometric descriptor.
         
         Args:
             encrypted_data: Encrypted bytes
-            shape: Original shape of the numpy array
-            dtype: Data type of the numpy array
+            shape: Optional shape of the numpy array (flat by default)
+            dtype: Data type of legacy Fernet descriptors
             
         Returns:
-            Decrypted NumPy array
+            Decrypted NumPy array (float32 for AES-GCM descriptors)
         """
-        # Decrypt
-        decrypted_bytes = self._cipher.decrypt(encrypted_data)
+        if encrypted_data[:1] == _AESGCM_VERSION:
+            nonce = encrypted_data[1:1 + _AESGCM_NONCE_SIZE]
+            decrypted_bytes = self._aesgcm.decrypt(nonce, encrypted_data[1 + _AESGCM_NONCE_SIZE:], None)
+            dtype = "<f4"
+        else:
+            # Fernet descriptors stored before AES-GCM
+            decrypted_bytes = self._get_fernet().decrypt(encrypted_data)
+        
         # Convert back to numpy array
         descriptor = np.frombuffer(decrypted_bytes, dtype=dtype)
-        return descriptor.reshape(shape)
+        return descriptor if shape is None else descriptor.reshape(shape)
 
 
 def pseudonymize_identifier(identifier: str) -> str:
@@ -84,7 +146,7 @@ def pseudonymize_identifier(identifier: str) -> str:
 def hash_password(password: str) -> str:
     """
     Hash a password using SHA-256.
-    Note: In production, use bcrypt via passlib (done in auth service).
+    Note: In production, use bcrypt (done in auth service).
     
     Args:
         password: Plain text password
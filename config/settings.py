@@ -16,14 +16,22 @@ class Settings(BaseSettings):
     # Security
     secret_key: str = "your-secret-key-change-this-in-production"
     algorithm: str = "HS256"
-    access_token_expire_minutes: int = 30
+    access_token_expire_minutes: int = 15
+    bcrypt_rounds: int = 12
     
     # Database
     database_url: str = "sqlite+aiosqlite:///./biometric_cicd.db"
+    db_pool_size: int = 10
+    db_max_overflow: int = 20
     
     # Biometric settings
     face_recognition_tolerance: float = 0.6
+    face_detection_model: str = "auto"  # auto, hog or cnn
     voice_mfcc_n_mfcc: int = 13
+    voice_sample_rate: int = 16000
+    voice_n_fft: int = 512  # 25 ms window / 10 ms hop at 16 kHz
+    voice_hop_length: int = 160
+    voice_win_length: int = 400
     similarity_threshold: float = 0.85
     
     # Encryption
@@ -2,13 +2,16 @@
 Main FastAPI application.
 """
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 import logging
 
 from config.settings import settings
-from app.core.database import init_db, close_db
+from app.core.database import init_db, warmup_pool, close_db
 from app.api import auth, biometric, cicd, audit
+from app.services.audit import audit_writer
+from app.services.face_recognition import shutdown_face_pool
 
 
 # Configure logging
@@ -33,11 +36,18 @@ async def lifespan(app: FastAPI):
     logger.info("Starting up application...")
     await init_db()
     logger.info("Database initialized")
+    await warmup_pool()
+    logger.info("Database connection pool warmed up")
+    audit_writer.start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down application...")
+    await audit_writer.stop()
+    logger.info("Audit log queue drained")
+    shutdown_face_pool()
+    logger.info("Face worker pool stopped")
     await close_db()
     logger.info("Database connections closed")
 
@@ -72,7 +82,8 @@ app = FastAPI(
     - User consent management
     """,
     lifespan=lifespan,
-    debug=settings.debug
+    debug=settings.debug,
+    default_response_class=ORJSONResponse
 )
 
 # CORS middleware
@@ -0,0 +1,21 @@
+"""
+Shared fixtures for the API tests.
+"""
+import pytest_asyncio
+from httpx import AsyncClient
+
+from main import app
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session")
+async def client():
+    """
+    One HTTP client for the whole test session.
+    
+    The application lifespan (database init, pool warm-up, audit writer)
+    runs once around the session instead of being skipped, and every test
+    shares the same event loop so pooled connections stay usable.
+    """
+    async with app.router.lifespan_context(app):
+        async with AsyncClient(app=app, base_url="http://test") as client:
+            yield client
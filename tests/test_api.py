@@ -1,18 +1,78 @@
 """
 Basic tests for the biometric CI/CD authentication system.
 """
+import asyncio
+import base64
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
 import pytest
-from httpx import AsyncClient
 from fastapi import status
 
-from main import app
+from app.api.dependencies import get_current_user, invalidate_user_cache
+from app.core.database import AsyncSessionLocal
+from app.models.database import ActionStatus, AuditLog
+
+# Share the session event loop with the ``client`` fixture
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+VOICE_SAMPLE = Path(__file__).resolve().parent.parent / "data" / "voices" / "1462-170142-0003.flac"
+
+
+async def _login_new_user(client, role: str = "devops"):
+    """Register a fresh user and return its auth headers and ID."""
+    username = f"user_{uuid.uuid4().hex[:12]}"
+    response = await client.post(
+        "/api/auth/register",
+        json={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": "SecureP@ss123",
+            "role": role,
+            "consent_given": True
+        }
+    )
+    assert response.status_code == status.HTTP_201_CREATED
+    user_id = response.json()["id"]
+    
+    response = await client.post(
+        "/api/auth/login",
+        data={"username": username, "password": "SecureP@ss123"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}, user_id
 
 
-@pytest.mark.asyncio
-async def test_root_endpoint():
+async def _wait_for_audit_logs(client, headers, user_id: int, expected: int):
+    """Poll until the background audit writer has flushed ``expected`` logs."""
+    for _ in range(100):
+        response = await client.get(f"/api/audit/logs/user/{user_id}", headers=headers)
+        assert response.status_code == status.HTTP_200_OK
+        if response.json()["total"] >= expected:
+            return
+        await asyncio.sleep(0.05)
+    pytest.fail(f"Expected {expected} audit logs for user {user_id}")
+
+
+async def _walk_audit_pages(client, headers, url: str, limit: int):
+    """Follow ``next_cursor`` from the first page to the last; return all IDs."""
+    ids = []
+    params = {"limit": limit}
+    for _ in range(100):
+        response = await client.get(url, headers=headers, params=params)
+        assert response.status_code == status.HTTP_200_OK
+        page = response.json()
+        ids.extend(log["id"] for log in page["logs"])
+        if page["next_cursor"] is None:
+            return ids
+        params = {"limit": limit, "cursor": page["next_cursor"]}
+    pytest.fail("Cursor pagination did not terminate")
+
+
+async def test_root_endpoint(client):
     """Test root endpoint returns correct response."""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        response = await client.get("/")
+    response = await client.get("/")
     
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
@@ -20,70 +80,229 @@ async def test_root_endpoint():
     assert "version" in data
 
 
-@pytest.mark.asyncio
-async def test_health_check():
+async def test_health_check(client):
     """Test health check endpoint."""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        response = await client.get("/health")
+    response = await client.get("/health")
     
     assert response.status_code == status.HTTP_200_OK
     data = response.json()
     assert data["status"] == "healthy"
 
 
-@pytest.mark.asyncio
-async def test_register_user():
+async def test_register_user(client):
     """Test user registration."""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        response = await client.post(
-            "/api/auth/register",
-            json={
-                "username": "testuser",
-                "email": "test@example.com",
-                "password": "SecureP@ss123",
-                "full_name": "Test User",
-                "role": "devops",
-                "consent_given": True
-            }
-        )
+    response = await client.post(
+        "/api/auth/register",
+        json={
+            "username": "testuser",
+            "email": "test@example.com",
+            "password": "SecureP@ss123",
+            "full_name": "Test User",
+            "role": "devops",
+            "consent_given": True
+        }
+    )
     
     assert response.status_code in [status.HTTP_201_CREATED, status.HTTP_400_BAD_REQUEST]
     # 400 is acceptable if user already exists
 
 
-@pytest.mark.asyncio
-async def test_register_without_consent():
+async def test_register_without_consent(client):
     """Test user registration fails without consent."""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        response = await client.post(
-            "/api/auth/register",
-            json={
-                "username": "testuser2",
-                "email": "test2@example.com",
-                "password": "SecureP@ss123",
-                "consent_given": False
-            }
-        )
+    response = await client.post(
+        "/api/auth/register",
+        json={
+            "username": "testuser2",
+            "email": "test2@example.com",
+            "password": "SecureP@ss123",
+            "consent_given": False
+        }
+    )
     
     assert response.status_code == status.HTTP_400_BAD_REQUEST
     assert "consent" in response.json()["detail"].lower()
 
 
-@pytest.mark.asyncio
-async def test_login_invalid_credentials():
+async def test_register_duplicate_username(client):
+    """Registering a taken username is rejected by the ON CONFLICT insert."""
+    username = f"dup_{uuid.uuid4().hex[:12]}"
+    payload = {
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "SecureP@ss123",
+        "consent_given": True
+    }
+    response = await client.post("/api/auth/register", json=payload)
+    assert response.status_code == status.HTTP_201_CREATED
+    
+    response = await client.post(
+        "/api/auth/register",
+        json={**payload, "email": f"other_{username}@example.com"}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Username already registered"
+
+
+async def test_register_duplicate_email(client):
+    """Registering a taken email is rejected by the ON CONFLICT insert."""
+    username = f"dup_{uuid.uuid4().hex[:12]}"
+    payload = {
+        "username": username,
+        "email": f"{username}@example.com",
+        "password": "SecureP@ss123",
+        "consent_given": True
+    }
+    response = await client.post("/api/auth/register", json=payload)
+    assert response.status_code == status.HTTP_201_CREATED
+    
+    response = await client.post(
+        "/api/auth/register",
+        json={**payload, "username": f"other_{username}"}
+    )
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json()["detail"] == "Email already registered"
+
+
+async def test_login_invalid_credentials(client):
     """Test login with invalid credentials."""
-    async with AsyncClient(app=app, base_url="http://test") as client:
-        response = await client.post(
-            "/api/auth/login",
-            data={
-                "username": "nonexistent",
-                "password": "wrongpassword"
-            }
-        )
+    response = await client.post(
+        "/api/auth/login",
+        data={
+            "username": "nonexistent",
+            "password": "wrongpassword"
+        }
+    )
     
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
 
 
-# Note: Additional tests would require setting up test fixtures
-# with actual biometric data and database mocking.
-# This is a basic test structure to demonstrate the testing approach.
+async def test_audit_cursor_pages_mix_denials_and_successes(client):
+    """Cursor pages over synchronous denials and batched successes never repeat rows."""
+    headers, user_id = await _login_new_user(client)
+    voice = VOICE_SAMPLE.read_bytes()
+    
+    # Successes go through the background writer, denials commit with the request
+    response = await client.post(
+        "/api/biometric/enroll",
+        headers=headers,
+        data={"biometric_type": "voice", "consent_confirmed": "true"},
+        files={"file": ("sample.flac", voice, "audio/flac")}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    for biometric_type in ("face", "voice", "face", "voice"):
+        await client.post(
+            "/api/biometric/authenticate",
+            headers=headers,
+            data={"biometric_type": biometric_type},
+            files={"file": ("sample.flac", voice, "audio/flac")}
+        )
+    await _wait_for_audit_logs(client, headers, user_id, expected=5)
+    
+    response = await client.get(f"/api/audit/logs/user/{user_id}", headers=headers)
+    logs = response.json()["logs"]
+    assert {log["status"] for log in logs} == {"approved", "denied"}
+    
+    ids = await _walk_audit_pages(client, headers, f"/api/audit/logs/user/{user_id}", limit=2)
+    assert ids == [log["id"] for log in logs]
+    assert len(set(ids)) == 5
+
+
+async def test_cached_user_survives_session_rollback(client):
+    """A rollback in the request that filled the token cache must not break later hits."""
+    headers, user_id = await _login_new_user(client)
+    token = headers["Authorization"].removeprefix("Bearer ")
+    
+    async with AsyncSessionLocal() as db:
+        user = await get_current_user(token=token, db=db)
+        assert user.id == user_id
+        await db.rollback()
+    
+    async with AsyncSessionLocal() as db:
+        cached = await get_current_user(token=token, db=db)
+        assert cached.id == user_id and cached.is_active
+    
+    response = await client.get("/api/auth/me", headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["id"] == user_id
+    
+    invalidate_user_cache(user_id)
+
+
+async def test_action_status_etag(client):
+    """Status polls get 304 while unchanged and a new ETag after the action is decided."""
+    headers, _ = await _login_new_user(client)
+    response = await client.post(
+        "/api/cicd/request-action",
+        headers=headers,
+        json={"action_type": "deploy", "description": "ETag test"}
+    )
+    assert response.status_code == status.HTTP_200_OK
+    action_id = response.json()["action_id"]
+    url = f"/api/cicd/action-status/{action_id}"
+    
+    response = await client.get(url, headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["status"] == "pending"
+    pending_etag = response.headers["ETag"]
+    
+    response = await client.get(url, headers={**headers, "If-None-Match": pending_etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["ETag"] == pending_etag
+    
+    # No voice is enrolled, so the approval attempt denies the action
+    response = await client.post(
+        "/api/cicd/approve-action",
+        headers=headers,
+        data={"action_id": action_id, "biometric_type": "voice"},
+        files={"file": ("sample.flac", VOICE_SAMPLE.read_bytes(), "audio/flac")}
+    )
+    assert response.json()["status"] == "denied"
+    
+    response = await client.get(url, headers={**headers, "If-None-Match": pending_etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["status"] == "denied"
+    denied_etag = response.headers["ETag"]
+    assert denied_etag != pending_etag
+    
+    response = await client.get(url, headers={**headers, "If-None-Match": f'W/{denied_etag}, "other"'})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+async def test_audit_cursor_pagination_walks_every_row_once(client):
+    """Following next_cursor visits each log exactly once, including timestamp ties."""
+    headers, user_id = await _login_new_user(client)
+    
+    # Pairs of rows share a timestamp, so the id tie-break decides their order
+    base = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        db.add_all([
+            AuditLog(
+                user_id=user_id,
+                action=f"event {i}",
+                action_type="authentication",
+                status=ActionStatus.DENIED,
+                timestamp=base - timedelta(seconds=i // 2)
+            )
+            for i in range(7)
+        ])
+        await db.commit()
+    
+    url = f"/api/audit/logs/user/{user_id}"
+    response = await client.get(url, headers=headers, params={"limit": 100})
+    expected = [log["id"] for log in response.json()["logs"]]
+    assert len(expected) == 7
+    
+    for limit in (1, 3, 7):
+        ids = await _walk_audit_pages(client, headers, url, limit=limit)
+        assert ids == expected
+
+
+async def test_audit_malformed_cursor_rejected(client):
+    """Cursors that do not decode to a (timestamp, id) pair get a 400."""
+    headers, user_id = await _login_new_user(client)
+    url = f"/api/audit/logs/user/{user_id}"
+    
+    for cursor in ("not a cursor!", base64.urlsafe_b64encode(b"no-separator").decode()):
+        response = await client.get(url, headers=headers, params={"cursor": cursor})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["detail"] == "Invalid pagination cursor"
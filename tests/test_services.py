@@ -0,0 +1,345 @@
+"""
+Unit tests for the biometric services.
+"""
+import asyncio
+import base64
+import logging
+import os
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+
+import librosa
+import numpy as np
+import pytest
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from sqlalchemy import select
+from sqlalchemy.exc import OperationalError
+
+from app.core.database import AsyncSessionLocal, init_db
+from app.models.database import ActionStatus, AuditLog, BiometricData, BiometricType
+from app.services import biometric as biometric_module
+from app.services import face_recognition as face_module
+from app.services.audit import AuditWriter
+from app.services.biometric import biometric_service
+from app.services.face_recognition import face_recognition_service
+from app.services.voice_recognition import voice_recognition_service
+from app.utils.encryption import EncryptionService, encryption_service
+from config.settings import settings
+
+
+DATA_DIR = Path(__file__).resolve().parent.parent / "data"
+FACE_SAMPLE = DATA_DIR / "faces" / "1477812374602827.jpeg"
+VOICE_SAMPLE = DATA_DIR / "voices" / "1462-170142-0003.flac"
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_face_pool_recovers_from_dead_worker():
+    """A worker crash breaks the pool once; the next analysis rebuilds it."""
+    pool = face_module._get_face_pool()
+    with pytest.raises(BrokenProcessPool):
+        await asyncio.wrap_future(pool.submit(os._exit, 1))
+    
+    encoding, quality = await face_recognition_service.analyze_async(FACE_SAMPLE.read_bytes())
+    
+    assert encoding is not None and encoding.shape == (128,)
+    assert 0.0 < quality <= 1.0
+    assert face_module._face_pool is not pool
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_audit_writer_retries_then_writes_row_by_row(caplog):
+    """A failing batch is retried, then written row by row; only the bad row is spilled."""
+    await init_db()
+    writer = AuditWriter(max_attempts=2, retry_delay=0)
+    marker = f"audit-writer-{uuid.uuid4().hex}"
+    
+    def audit_log(action):
+        return AuditLog(
+            action=action,
+            action_type="authentication",
+            status=ActionStatus.DENIED,
+            details=marker,
+            timestamp=datetime.utcnow()
+        )
+    
+    # action is NOT NULL, so the middle row makes every batch insert fail
+    records = [audit_log("first"), audit_log(None), audit_log("third")]
+    with caplog.at_level(logging.WARNING, logger="app.services.audit"):
+        await writer._write(records)
+    
+    async with AsyncSessionLocal() as db:
+        written = (await db.scalars(
+            select(AuditLog.action).where(AuditLog.details == marker).order_by(AuditLog.id)
+        )).all()
+    assert written == ["first", "third"]
+    
+    messages = [record.getMessage() for record in caplog.records]
+    assert sum("attempt" in message for message in messages) == 2
+    spilled = [message for message in messages if message.startswith("Audit log could not be written")]
+    assert len(spilled) == 1 and marker in spilled[0]
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_audit_writer_retries_transient_failure(monkeypatch):
+    """A flush that fails once is retried and the whole batch is written together."""
+    writer = AuditWriter(retry_delay=0)
+    calls = []
+    
+    async def flaky_insert(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+    
+    monkeypatch.setattr(writer, "_insert", flaky_insert)
+    await writer._write([
+        AuditLog(action=f"a{i}", action_type="approval", status=ActionStatus.APPROVED)
+        for i in range(3)
+    ])
+    
+    assert calls == [3, 3]
+
+
+def test_descriptor_encryption_round_trip():
+    """Descriptors round-trip as float32 in the fixed-size AES-GCM format."""
+    service = EncryptionService("unit-test-key")
+    descriptor = np.random.default_rng(0).normal(size=128)
+    
+    encrypted = service.encrypt_descriptor(descriptor)
+    
+    assert encrypted[:1] == b"\x03" and len(encrypted) == 541
+    decrypted = service.decrypt_descriptor(encrypted)
+    assert decrypted.dtype == np.float32
+    np.testing.assert_array_equal(decrypted, descriptor.astype(np.float32))
+    with pytest.raises(InvalidTag):
+        EncryptionService("another-key").decrypt_descriptor(encrypted)
+
+
+def test_decrypts_legacy_fernet_descriptor():
+    """Fernet descriptors written by the original service still decrypt."""
+    descriptor = np.random.default_rng(1).normal(size=26)
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=b"biometric-cicd-salt", iterations=100000)
+    legacy = Fernet(base64.urlsafe_b64encode(kdf.derive(b"unit-test-key"))).encrypt(descriptor.tobytes())
+    
+    decrypted = EncryptionService("unit-test-key").decrypt_descriptor(legacy)
+    
+    np.testing.assert_array_equal(decrypted, descriptor)
+
+
+def _metrics_by_threshold_loop(service, known_features, test_features_list, thresholds):
+    """The original per-threshold FAR/FRR loop, run over the given thresholds."""
+    far_list, frr_list = [], []
+    for threshold in thresholds:
+        false_accepts = false_rejects = total_imposters = total_genuine = 0
+        for features, is_genuine in test_features_list:
+            _, similarity = service.compare_voices(known_features, features)
+            if is_genuine:
+                total_genuine += 1
+                if similarity < threshold:
+                    false_rejects += 1
+            else:
+                total_imposters += 1
+                if similarity >= threshold:
+                    false_accepts += 1
+        far_list.append(false_accepts / total_imposters if total_imposters > 0 else 0)
+        frr_list.append(false_rejects / total_genuine if total_genuine > 0 else 0)
+    
+    far_array, frr_array = np.array(far_list), np.array(frr_list)
+    eer_idx = np.argmin(np.abs(far_array - frr_array))
+    return {
+        "FAR": float(far_array[eer_idx]),
+        "FRR": float(frr_array[eer_idx]),
+        "EER": float((far_array[eer_idx] + frr_array[eer_idx]) / 2)
+    }
+
+
+def test_voice_metrics_match_threshold_loop():
+    """The sorted EER sweep equals the per-threshold loop run at every observed score."""
+    rng = np.random.default_rng(2)
+    known = rng.normal(size=26)
+    samples = [
+        (known + rng.normal(scale=scale, size=26), bool(is_genuine))
+        for scale, is_genuine in zip(rng.uniform(0.2, 3.0, 40), rng.integers(0, 2, 40))
+    ]
+    # A zero vector, and a genuine/imposter pair with the same score
+    samples += [(np.zeros(26), False), (samples[0][0], not samples[0][1])]
+    
+    scores = sorted({voice_recognition_service.compare_voices(known, f)[1] for f, _ in samples})
+    expected = _metrics_by_threshold_loop(voice_recognition_service, known, samples, scores + [np.inf])
+    
+    metrics = voice_recognition_service.calculate_metrics(known, samples)
+    for key in ("FAR", "FRR", "EER"):
+        assert metrics[key] == pytest.approx(expected[key], abs=1e-12)
+    
+    # Perfectly separated scores give no error on either side
+    separated = [(known, True), (known * 2, True), (-known, False), (np.zeros(26), False)]
+    assert voice_recognition_service.calculate_metrics(known, separated) == {"FAR": 0.0, "FRR": 0.0, "EER": 0.0}
+
+
+def test_compare_voices_zero_vector_scores_zero():
+    """A zero-norm feature vector scores 0.0 and never matches."""
+    known = np.ones(26, dtype=np.float32)
+    
+    is_match, similarity = voice_recognition_service.compare_voices(known, np.zeros(26, dtype=np.float32))
+    
+    assert similarity == 0.0 and not is_match
+    np.testing.assert_array_equal(
+        voice_recognition_service._cosine_similarities(known, np.zeros((2, 26), dtype=np.float32)),
+        [0.0, 0.0]
+    )
+
+
+def test_compare_many_matches_face_distance():
+    """1:N search agrees with face_distance, flags rows within tolerance, handles no rows."""
+    rng = np.random.default_rng(3)
+    known = rng.normal(scale=0.1, size=(5, 128))
+    probe = known[2] + rng.normal(scale=0.01, size=128)
+    
+    best, distance, mask = face_recognition_service.compare_many(known, probe)
+    
+    expected = face_module.face_recognition.face_distance(known, probe)
+    assert best == 2
+    assert distance == pytest.approx(expected[2], rel=1e-4)
+    np.testing.assert_array_equal(mask, expected <= face_recognition_service.tolerance)
+    
+    known_sq = np.einsum("ij,ij->i", known, known)
+    best_sq, distance_sq, _ = face_recognition_service.compare_many(known, probe, known_sq=known_sq)
+    assert best_sq == best and distance_sq == pytest.approx(distance, rel=1e-4)
+    
+    # Far from every enrolled face: the closest row is still reported, nothing matches
+    best, distance, mask = face_recognition_service.compare_many(known, probe + 1.0)
+    assert distance > face_recognition_service.tolerance and not mask.any()
+    
+    best, distance, mask = face_recognition_service.compare_many(np.empty((0, 128)), probe)
+    assert (best, distance, mask.shape) == (-1, float("inf"), (0,))
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_get_active_descriptors_feeds_authentication():
+    """Bulk lookup returns active enrollments only, and authentication can use the result."""
+    await init_db()
+    voice = VOICE_SAMPLE.read_bytes()
+    descriptor = encryption_service.encrypt_descriptor(voice_recognition_service.extract_voice_features(voice))
+    active, inactive, face_only, unknown = (uuid.uuid4().int % 2**31 for _ in range(4))
+    
+    async with AsyncSessionLocal() as db:
+        db.add_all([
+            BiometricData(user_id=active, biometric_type=BiometricType.VOICE, encrypted_descriptor=descriptor),
+            BiometricData(user_id=inactive, biometric_type=BiometricType.VOICE,
+                          encrypted_descriptor=descriptor, is_active=False),
+            BiometricData(user_id=face_only, biometric_type=BiometricType.FACE, encrypted_descriptor=descriptor),
+        ])
+        await db.commit()
+    
+    async with AsyncSessionLocal() as db:
+        enrolled = await biometric_service.get_active_descriptors(
+            db, [active, inactive, face_only, unknown], BiometricType.VOICE
+        )
+        assert list(enrolled) == [active]
+        assert await biometric_service.get_active_descriptors(db, [], BiometricType.VOICE) == {}
+        
+        result = await biometric_service.authenticate_biometric(
+            db, active, BiometricType.VOICE, voice, enrolled=enrolled
+        )
+        assert result["authenticated"] and result["similarity_score"] == pytest.approx(1.0)
+        
+        # Users missing from the prefetched map are denied without a lookup
+        result = await biometric_service.authenticate_biometric(
+            db, inactive, BiometricType.VOICE, voice, enrolled=enrolled
+        )
+        assert not result["success"] and not result["authenticated"]
+
+
+def test_compare_voices_batch_matches_pairwise_scores():
+    """Batch scores equal compare_voices row by row and honour the threshold."""
+    rng = np.random.default_rng(11)
+    probe = rng.normal(size=16)
+    known = np.vstack([probe * 2.0, -probe, rng.normal(size=16)])
+    
+    similarities, matches = voice_recognition_service.compare_voices_batch(known, probe)
+    expected = [voice_recognition_service.compare_voices(row, probe)[1] for row in known]
+    assert similarities == pytest.approx(expected)
+    assert matches.tolist() == [s >= settings.similarity_threshold for s in similarities]
+    assert matches[0] and not matches[1]
+    
+    normalized = known / np.linalg.norm(known, axis=1, keepdims=True)
+    norm_sims, norm_matches = voice_recognition_service.compare_voices_batch(
+        normalized, probe, known_normalized=True
+    )
+    assert norm_sims == pytest.approx(similarities)
+    assert norm_matches.tolist() == matches.tolist()
+    
+    zero_sims, zero_matches = voice_recognition_service.compare_voices_batch(
+        normalized, np.zeros(16), known_normalized=True
+    )
+    assert zero_sims.tolist() == [0.0, 0.0, 0.0] and not zero_matches.any()
+    
+    for empty in ([], np.empty((0, 16))):
+        for known_normalized in (False, True):
+            sims, mask = voice_recognition_service.compare_voices_batch(
+                empty, probe, known_normalized=known_normalized
+            )
+            assert sims.shape == (0,) and mask.shape == (0,)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_failed_commit_writes_no_approved_audit(monkeypatch):
+    """A success whose transaction fails to commit must not reach the audit log."""
+    await init_db()
+    writer = AuditWriter()
+    writer.start()
+    monkeypatch.setattr(biometric_module, "audit_writer", writer)
+    voice = VOICE_SAMPLE.read_bytes()
+    user_id = uuid.uuid4().int % 2**31
+    
+    async with AsyncSessionLocal() as db:
+        db.add(BiometricData(
+            user_id=user_id,
+            biometric_type=BiometricType.VOICE,
+            encrypted_descriptor=encryption_service.encrypt_descriptor(
+                voice_recognition_service.extract_voice_features(voice)
+            )
+        ))
+        await db.commit()
+    
+    async def failing_commit():
+        raise OperationalError("COMMIT", {}, Exception("database is locked"))
+    
+    try:
+        async with AsyncSessionLocal() as db:
+            monkeypatch.setattr(db, "commit", failing_commit)
+            enrolled = await biometric_service.enroll_biometric(db, user_id, BiometricType.VOICE, voice)
+            authenticated = await biometric_service.authenticate_biometric(
+                db, user_id, BiometricType.VOICE, voice
+            )
+    finally:
+        await writer.stop()
+    
+    assert not enrolled["success"] and not authenticated["success"]
+    async with AsyncSessionLocal() as db:
+        approved = await db.scalars(
+            select(AuditLog).where(AuditLog.user_id == user_id, AuditLog.status == ActionStatus.APPROVED)
+        )
+        assert approved.all() == []
+
+
+@pytest.mark.parametrize("sr", [voice_recognition_service.sample_rate, 22050])
+def test_mfcc_matches_librosa(sr):
+    """The cached-filterbank MFCC must keep matching librosa.feature.mfcc, or stored templates drift."""
+    service = voice_recognition_service
+    t = np.arange(sr, dtype=np.float32) / sr
+    rng = np.random.default_rng(5)
+    y = (0.5 * np.sin(2 * np.pi * (200 + 800 * t) * t) + 0.05 * rng.normal(size=sr)).astype(np.float32)
+    
+    expected = librosa.feature.mfcc(
+        y=y, sr=sr, n_mfcc=service.n_mfcc, n_fft=service.n_fft,
+        hop_length=service.hop_length, win_length=service.win_length
+    )
+    mfccs = service._mfcc(y, sr)
+    
+    assert mfccs.shape == expected.shape
+    np.testing.assert_allclose(mfccs, expected, rtol=1e-4, atol=1e-3 * np.abs(expected).max())